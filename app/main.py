@@ -234,6 +234,23 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+def load_recent_data(db: Session, limit: int = 100) -> bool:
+    """Load the latest sensor readings into the shared LangChain service"""
+    recent_data = data_service.get_latest_data(db, limit=limit)
+    
+    # Convert to dict format for LangChain
+    data_dicts = [
+        {
+            "id": item.id,
+            "timestamp": item.timestamp.isoformat(),
+            "sensor_type": item.sensor_type,
+            "value": item.value
+        }
+        for item in recent_data
+    ]
+    
+    return langchain_service.load_data_from_db(data_dicts)
+
 # LangChain Analysis Endpoints
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze_data(
@@ -243,24 +260,10 @@ async def analyze_data(
     """Analyze data using LangChain AI"""
     try:
         # Get recent data for analysis
-        recent_data = data_service.get_latest_data(db, limit=100)
-        
-        # Convert to dict format for LangChain
-        data_dicts = [
-            {
-                "id": item.id,
-                "timestamp": item.timestamp.isoformat(),
-                "sensor_type": item.sensor_type,
-                "value": item.value
-            }
-            for item in recent_data
-        ]
-        
-        # Load data into LangChain service
-        langchain_service.load_data_from_db(data_dicts)
+        load_recent_data(db)
         
         # Perform analysis
-        result = langchain_service.analyze(request.query)
+        result = await langchain_service.aanalyze(request.query)
         
         return AnalysisResponse(**result)
         
@@ -272,6 +275,60 @@ async def analyze_data(
             timestamp=datetime.utcnow().isoformat()
         )
 
+@app.post("/analyze/stream")
+async def analyze_data_stream(
+    request: AnalysisRequest,
+    db: Session = Depends(get_db)
+):
+    """Stream LangChain AI analysis tokens as server-sent events"""
+    try:
+        # Load and snapshot the prompt now: the stream runs after this handler returns,
+        # when other requests may already have loaded different data into the shared service
+        load_recent_data(db)
+        immediate_result, tokens = langchain_service.start_analysis_stream(request.query)
+        
+        async def generate_stream():
+            accumulated_response = ""
+            error = None
+            if immediate_result is not None:
+                # No LLM call (no data, mock LLM or a failed snapshot): send the result as one token
+                error = immediate_result.get("error")
+                accumulated_response = immediate_result.get("response") or error or ""
+                yield f"data: {json.dumps({'token': accumulated_response}, ensure_ascii=False)}\n\n"
+            else:
+                try:
+                    async for token in tokens:
+                        accumulated_response += token
+                        yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+                except Exception as e:
+                    logger.error(f"Error in streaming analysis: {str(e)}")
+                    error = str(e)
+                    error_token = f"Error: {error}"
+                    yield f"data: {json.dumps({'token': error_token}, ensure_ascii=False)}\n\n"
+            
+            final_result = {
+                'success': error is None,
+                'response': accumulated_response,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            if error is not None:
+                final_result['error'] = error
+            yield f"data: {json.dumps({'step': 'complete', 'result': final_result}, ensure_ascii=False)}\n\n"
+            yield f"data: [DONE]\n\n"
+        
+        return StreamingResponse(
+            generate_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+            }
+        )
+        
+    except Exception as e:
+        logger.error(f"Error in streaming analysis: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Streaming analysis failed: {str(e)}")
+
 @app.post("/visualize", response_model=VisualizationResponse)
 async def create_visualization(
     request: VisualizationRequest,
@@ -280,21 +337,7 @@ async def create_visualization(
     """Create data visualization"""
     try:
         # Get recent data for visualization
-        recent_data = data_service.get_latest_data(db, limit=100)
-        
-        # Convert to dict format for LangChain
-        data_dicts = [
-            {
-                "id": item.id,
-                "timestamp": item.timestamp.isoformat(),
-                "sensor_type": item.sensor_type,
-                "value": item.value
-            }
-            for item in recent_data
-        ]
-        
-        # Load data into LangChain service
-        langchain_service.load_data_from_db(data_dicts)
+        load_recent_data(db)
         
         # Create visualization
         result = langchain_service.create_visualization(request.chart_type, request.columns)
@@ -313,21 +356,7 @@ async def get_data_summary(db: Session = Depends(get_db)):
     """Get comprehensive data summary for LangChain analysis"""
     try:
         # Get recent data
-        recent_data = data_service.get_latest_data(db, limit=100)
-        
-        # Convert to dict format
-        data_dicts = [
-            {
-                "id": item.id,
-                "timestamp": item.timestamp.isoformat(),
-                "sensor_type": item.sensor_type,
-                "value": item.value
-            }
-            for item in recent_data
-        ]
-        
-        # Load data into LangChain service
-        langchain_service.load_data_from_db(data_dicts)
+        load_recent_data(db)
         
         # Get summary
         summary = langchain_service.get_data_summary()
@@ -651,11 +680,12 @@ async def ask_with_streaming(request: dict):
         logger.info(f" Streaming: Processing query through intent router: {query}")
         
         try:
-            # Call intent router layer synchronously (same as regular endpoint)
+            # Call intent router layer synchronously; mixed-query merge is streamed below
             result = intent_router_layer.process_query(
                 query=query,
                 session_id=session_id,
-                feature_context=feature_context
+                feature_context=feature_context,
+                stream_merge=True
             )
             
             print(f" STEP 1 RESULT - Intent Router:")
@@ -845,7 +875,14 @@ Provide an intelligent, helpful response with a clean data section using the act
                 accumulated_response = ""
                 token_count = 0
                 print(f"🚀 Starting LLM streaming...")
-                async for token in unified_service.translator.stream_response(streaming_prompt):
+                if result.get('merge_prompt'):
+                    # Mixed query: stream the deferred merge instead of a second analysis prompt
+                    token_stream = intent_router_layer.astream_merge_results(
+                        result['merge_prompt'], result.get('response', ''), result.get('detected_language', 'en')
+                    )
+                else:
+                    token_stream = unified_service.translator.stream_response(streaming_prompt)
+                async for token in token_stream:
                     token_count += 1
                     accumulated_response += token
                     yield f"data: {json.dumps({'step': 4, 'token': token, 'accumulated': accumulated_response, 'progress': 85}, ensure_ascii=False)}\n\n"
@@ -854,6 +891,13 @@ Provide an intelligent, helpful response with a clean data section using the act
                 print(f"✅ Streaming completed. Total tokens: {token_count}")
                 logger.info(f" Streaming completed. Total tokens: {token_count}")
                 
+                if result.get('merge_prompt'):
+                    # The router deferred saving; record the merged answer the user actually received
+                    result['response'] = accumulated_response
+                    await asyncio.to_thread(
+                        intent_router_layer.save_streamed_response, session_id, query, accumulated_response, result
+                    )
+                
                 # Step 5: Final formatting
                 yield f"data: {json.dumps({'step': 5, 'message': 'Finalizing response...', 'progress': 90}, ensure_ascii=False)}\n\n"
                 await asyncio.sleep(0.1)
@@ -906,10 +950,10 @@ Provide an intelligent, helpful response with a clean data section using the act
         raise HTTPException(status_code=500, detail=f"Streaming failed: {str(e)}")
 
 @app.get("/ask/health")
-async def intent_router_health():
+async def intent_router_health(deep: bool = False):
     """Health check for Intent Router Layer"""
     try:
-        return intent_router_layer.get_health_status()
+        return intent_router_layer.get_health_status(deep=deep)
     except Exception as e:
         logger.error(f"Intent Router health check error: {e}")
         return {
@@ -4,8 +4,12 @@ Smart intent detection and routing system for agriculture queries
 """
 
 import os
+import re
+import time
+import asyncio
+import threading
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Literal
 from datetime import datetime
 import json
 import sqlite3
@@ -20,11 +24,130 @@ from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferWindowMemory
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, ConfigDict, Field
 
 logger = logging.getLogger(__name__)
 
 # MockLLM removed - using real LLM only
 
+# Minimum seconds between synthetic (LLM-backed) health checks
+HEALTH_DEEP_CHECK_INTERVAL = 60
+
+# Appended to every merged mixed-query response
+MIXED_QUERY_FOOTER = "\n\n---\n Mixed Query - Combined data analysis and conversation"
+
+# Language line of the merge prompt; a streamed merge skips the translation step, so it must ask for Persian itself
+_MERGE_LANGUAGE_INSTRUCTIONS = {
+    "fa": "IMPORTANT: The user query is in Persian (Farsi). You MUST respond in Persian (Farsi) with proper Persian text.",
+}
+_DEFAULT_MERGE_LANGUAGE_INSTRUCTION = "If user speaks Persian, reply in Persian; if English, reply in English"
+
+def _format_data_point(data_point: Dict[str, Any]) -> str:
+    """One sensor reading line for the merge prompt, for raw (value) or aggregated (avg_value) rows"""
+    sensor_type = data_point.get('sensor_type', 'unknown')
+    if 'avg_value' in data_point:
+        avg_value = data_point.get('avg_value', 'N/A')
+        min_value = data_point.get('min_value', 'N/A')
+        max_value = data_point.get('max_value', 'N/A')
+        time_period = data_point.get('time_period', 'N/A')
+        return f"- {sensor_type}: Avg: {avg_value}, Min: {min_value}, Max: {max_value} ({time_period})\n"
+    value = data_point.get('value', 'N/A')
+    timestamp = data_point.get('timestamp', 'N/A')
+    return f"- {sensor_type}: {value} (at {timestamp})\n"
+
+def _keyword_pattern(keywords) -> "re.Pattern":
+    """Compile a keyword list into a single substring-matching alternation"""
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+# Persian comparison keywords - STRICT: Only explicit comparison words
+PERSIAN_COMPARISON_WORDS = ("مقایسه", "تفاوت", "نسبت", "در مقابل", "با", "بین")
+
+# English comparison keywords - STRICT: Only explicit comparison words
+ENGLISH_COMPARISON_WORDS = ("compare", "comparison", "difference", "versus", "vs", "against", "contrast")
+
+# Comparison patterns - STRICT: Only explicit comparison patterns
+COMPARISON_PATTERNS = (
+    r'امروز.*دیروز',  # "today ... yesterday" in Persian
+    r'today.*yesterday',  # "today ... yesterday" in English
+    r'هفته.*هفته',  # "week ... week" in Persian
+    r'week.*week',  # "week ... week" in English
+    r'مقایسه.*با',  # "compare with" in Persian
+    r'compare.*with',  # "compare with" in English
+    r'تفاوت.*بین',  # "difference between" in Persian
+    r'difference.*between',  # "difference between" in English
+)
+
+_COMPARISON_RE = re.compile("|".join(
+    [re.escape(word) for word in PERSIAN_COMPARISON_WORDS + ENGLISH_COMPARISON_WORDS] + list(COMPARISON_PATTERNS)
+))
+
+# Dangerous queries (specific phrases to avoid false positives)
+DANGEROUS_KEYWORDS = ('drop table', 'delete from', 'update set', 'insert into', 'alter table', 'create table',
+                      'truncate table', 'remove table', 'clear table')
+
+ALERT_KEYWORDS = (
+    # English keywords
+    'alert', 'notify', 'warning', 'threshold', 'monitor', 'create alert', 'alert me', 'set alert',
+    'send me a message', 'message when', 'notify when', 'alert when', 'warn when',
+    # Persian keywords
+    'هشدار', 'اعلان', 'اطلاع', 'بهم هشدار بده', 'به من هشدار بده', 'هشدار بده', 'اعلان بده', 'اطلاع بده',
+    'زمانی که', 'وقتی که', 'قتی', 'اگر', 'هنگامی که', 'پیامک', 'اس ام اس', 'sms', 'بیشتر از', 'کمتر از',
+    'پیام بده', 'بهم پیام بده', 'به من پیام بده'
+)
+
+AGRICULTURAL_TERMS = (
+    'irrigation', 'watering', 'soil', 'soil moisture', 'temperature', 'humidity', 
+    'pests', 'pest', 'pesticide', 'greenhouse', 'environment', 'environmental',
+    'leaf wetness', 'fruit count', 'fruit size', 'plant height', 'co2', 'co2 level',
+    'light', 'wind speed', 'rainfall', 'disease risk', 'yield prediction', 
+    'energy usage', 'water usage', 'fertilizer', 'nutrient', 'ph', 'pressure',
+    'motion', 'detection', 'efficiency', 'prediction', 'moisture', 'wetness'
+)
+
+DATA_QUESTION_WORDS = ('what is', 'how much', 'how many', 'show me', 'current', 'latest', 'status')
+
+# Keyword detectors, compiled once at import and checked in priority order
+_INTENT_PATTERNS = {
+    "dangerous": _keyword_pattern(DANGEROUS_KEYWORDS),
+    "alert": _keyword_pattern(ALERT_KEYWORDS),
+    "agricultural": _keyword_pattern(AGRICULTURAL_TERMS),
+    "data_question": _keyword_pattern(DATA_QUESTION_WORDS),
+}
+
+class QueryClassification(BaseModel):
+    """Structured output of the combined translate+classify LLM call"""
+    model_config = ConfigDict(extra='ignore')
+    
+    language: Literal['fa', 'en']
+    intent: Literal['data_query', 'mixed', 'alert_management']
+    is_comparison: bool = False
+    english_query: str = Field(description="The query translated to natural English")
+
+class IntentDetection(BaseModel):
+    """Structured output of the English intent-classification LLM call"""
+    model_config = ConfigDict(extra='ignore')
+    
+    intent: Literal['data_query', 'mixed']
+
+CLASSIFICATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert translator and intent classifier for agriculture/greenhouse AI assistant queries.
+
+For the user query return:
+- language: 'fa' if the query is Persian, otherwise 'en'
+- english_query: the query translated into natural, fluent English (unchanged if already English)
+- intent: one of
+  - data_query: questions asking for specific data, measurements, statistics or sensor readings, including recommendations that depend on data
+  - mixed: questions that combine data requests with explanations or reasoning
+  - alert_management: requests to create, list or delete alerts/notifications
+- is_comparison: true only for explicit comparisons (compare, difference between, versus, today vs yesterday)
+
+Respond with a JSON object with exactly these keys: language, english_query, intent, is_comparison.
+
+Translation examples:
+{examples}"""),
+    ("human", "Query: {query}{context_info}")
+])
+
 class IntentRouterLayer:
     """Complete Intent Router Layer with smart intent detection and routing"""
     
@@ -48,12 +171,24 @@ class IntentRouterLayer:
             logger.error(f" Intent Router: API key value: {self.api_key}")
             raise ValueError(" Intent Router: OpenAI API key is required. Please set OPENAI_API_KEY environment variable.")
         
+        # JSON-mode client for classification prompts; self.llm stays free-text
+        self.llm_json = ChatOpenAI(
+            openai_api_key=self.api_key,
+            openai_api_base=self.base_url,
+            model_name=self.model_name,
+            temperature=0.1,
+            model_kwargs={"response_format": {"type": "json_object"}}
+        )
+        
         # Initialize conversation memory (k=10 window)
         self.conversation_memories = {}  # session_id -> ConversationBufferWindowMemory
         
         # Initialize session storage (database storage)
         self.session_storage = SessionStorage()
         
+        # (monotonic time, success) of the last deep health check
+        self._last_deep_check = None
+        
         # Initialize services
         self._initialize_services()
         
@@ -61,6 +196,23 @@ class IntentRouterLayer:
         
         # Start session cleanup task
         self._start_session_cleanup()
+        
+        # Pay one-time connection/schema costs off the request path
+        threading.Thread(target=self._warmup, name="intent-router-warmup", daemon=True).start()
+    
+    def _warmup(self):
+        """Prime LLM connections and the SQL schema cache before the first real query"""
+        try:
+            # Establish TLS + DNS caches for both LLM clients
+            self.llm.invoke("ping")
+            self.llm_json.invoke('Reply with the JSON object {"status": "ok"}')
+            
+            # Prime the SQL schema reflection used by the semantic service
+            self.unified_semantic_service.sql_db.get_table_info()
+            
+            logger.info(" Intent Router warmup completed")
+        except Exception as e:
+            logger.warning(f" Intent Router warmup failed: {str(e)}")
     
     def _initialize_services(self):
         """Initialize required services"""
@@ -101,42 +253,24 @@ class IntentRouterLayer:
     
     def _detect_comparison_intent(self, query: str) -> bool:
         """Detect comparison intent in query (language-independent)"""
-        query_lower = query.lower()
-        
-        # Persian comparison keywords - STRICT: Only explicit comparison words
-        persian_comparison_words = [
-            "مقایسه", "تفاوت", "نسبت", "در مقابل", "با", "بین"
-        ]
-        
-        # English comparison keywords - STRICT: Only explicit comparison words
-        english_comparison_words = [
-            "compare", "comparison", "difference", "versus", "vs", "against", "contrast"
-        ]
-        
-        # Check for comparison patterns - STRICT: Only explicit comparison patterns
-        comparison_patterns = [
-            r'امروز.*دیروز',  # "today ... yesterday" in Persian
-            r'today.*yesterday',  # "today ... yesterday" in English
-            r'هفته.*هفته',  # "week ... week" in Persian
-            r'week.*week',  # "week ... week" in English
-            r'مقایسه.*با',  # "compare with" in Persian
-            r'compare.*with',  # "compare with" in English
-            r'تفاوت.*بین',  # "difference between" in Persian
-            r'difference.*between',  # "difference between" in English
-        ]
-        
-        # Check for comparison keywords
-        for word in persian_comparison_words + english_comparison_words:
-            if word in query_lower:
-                return True
-        
-        # Check for comparison patterns
-        import re
-        for pattern in comparison_patterns:
-            if re.search(pattern, query_lower):
-                return True
-        
-        return False
+        return _COMPARISON_RE.search(query.lower()) is not None
+    
+    def _classify_query(self, query: str, conversation_context: str = "") -> QueryClassification:
+        """Translate and classify a query with a single structured LLM call"""
+        examples = "\n".join(
+            f"Persian: {ex['persian']}\nEnglish: {ex['english']}"
+            for ex in self.unified_semantic_service.translator.few_shot_examples
+        )
+        context_info = f"\nPrevious conversation:\n{conversation_context}" if conversation_context else ""
+        messages = CLASSIFICATION_PROMPT.format_messages(
+            examples=examples,
+            query=query,
+            context_info=context_info
+        )
+        response = self.llm_json.invoke(messages)
+        classification = QueryClassification.model_validate_json(response.content)
+        logger.info(f" Query classified: intent={classification.intent}, comparison={classification.is_comparison}")
+        return classification
     
     def _translate_query(self, persian_query: str) -> str:
         """Translate Persian query to English using Unified Semantic Service's translator"""
@@ -173,58 +307,45 @@ class IntentRouterLayer:
         
         return " ".join(translated_words)
     
+    def _detect_intent_by_keywords(self, english_query: str, original_query: str = None) -> Optional[str]:
+        """Detect user intent from keywords only; returns None when the LLM is needed"""
+        query_lower = english_query.lower()
+        
+        # First check for dangerous queries (more specific to avoid false positives)
+        match = _INTENT_PATTERNS["dangerous"].search(query_lower)
+        if match:
+            logger.warning(f"  Dangerous query detected: {match.group(0)}")
+            return 'data_query'  # Route to data_query to trigger SQL validation
+        
+        # NEW: Check for alert management commands (BEFORE agricultural terms)
+        # Check both original query and English query for Persian/English keywords
+        match = _INTENT_PATTERNS["alert"].search(query_lower) or (original_query and _INTENT_PATTERNS["alert"].search(original_query))
+        if match:
+            logger.info(f" Alert keyword '{match.group(0)}' detected, classifying as alert_management")
+            return 'alert_management'
+        
+        # FALLBACK: Check for agricultural sensor terms first (before LLM)
+        match = _INTENT_PATTERNS["agricultural"].search(query_lower)
+        if match:
+            logger.info(f" Agricultural term '{match.group(0)}' detected, classifying as data_query")
+            return 'data_query'
+        
+        # Check for question words that suggest data queries
+        match = _INTENT_PATTERNS["data_question"].search(query_lower)
+        if match:
+            logger.info(f" Data question word '{match.group(0)}' detected, classifying as data_query")
+            return 'data_query'
+        
+        return None
+    
     def _detect_intent(self, english_query: str, conversation_context: str = "", original_query: str = None) -> str:
         """Detect user intent using LLM"""
         try:
             context_info = f"\nPrevious conversation:\n{conversation_context}" if conversation_context else ""
             
-            # First check for dangerous queries (more specific to avoid false positives)
-            dangerous_keywords = ['drop table', 'delete from', 'update set', 'insert into', 'alter table', 'create table', 'truncate table', 'remove table', 'clear table']
-            query_lower = english_query.lower()
-            
-            for keyword in dangerous_keywords:
-                if keyword in query_lower:
-                    logger.warning(f"  Dangerous query detected: {keyword}")
-                    return 'data_query'  # Route to data_query to trigger SQL validation
-            
-            # NEW: Check for alert management commands (BEFORE agricultural terms)
-            alert_keywords = [
-                # English keywords
-                'alert', 'notify', 'warning', 'threshold', 'monitor', 'create alert', 'alert me', 'set alert',
-                'send me a message', 'message when', 'notify when', 'alert when', 'warn when',
-                # Persian keywords
-                'هشدار', 'اعلان', 'اطلاع', 'بهم هشدار بده', 'به من هشدار بده', 'هشدار بده', 'اعلان بده', 'اطلاع بده',
-                'زمانی که', 'وقتی که', 'قتی', 'اگر', 'هنگامی که', 'پیامک', 'اس ام اس', 'sms', 'بیشتر از', 'کمتر از',
-                'پیام بده', 'بهم پیام بده', 'به من پیام بده'
-            ]
-            for keyword in alert_keywords:
-                # Check both original query and English query for Persian/English keywords
-                if keyword in query_lower or (original_query and keyword in original_query):
-                    logger.info(f" Alert keyword '{keyword}' detected, classifying as alert_management")
-                    return 'alert_management'
-            
-            # FALLBACK: Check for agricultural sensor terms first (before LLM)
-            agricultural_terms = [
-                'irrigation', 'watering', 'soil', 'soil moisture', 'temperature', 'humidity', 
-                'pests', 'pest', 'pesticide', 'greenhouse', 'environment', 'environmental',
-                'leaf wetness', 'fruit count', 'fruit size', 'plant height', 'co2', 'co2 level',
-                'light', 'wind speed', 'rainfall', 'disease risk', 'yield prediction', 
-                'energy usage', 'water usage', 'fertilizer', 'nutrient', 'ph', 'pressure',
-                'motion', 'detection', 'efficiency', 'prediction', 'moisture', 'wetness'
-            ]
-            
-            # If query contains agricultural terms, classify as data_query
-            for term in agricultural_terms:
-                if term in query_lower:
-                    logger.info(f" Agricultural term '{term}' detected, classifying as data_query")
-                    return 'data_query'
-            
-            # Check for question words that suggest data queries
-            data_question_words = ['what is', 'how much', 'how many', 'show me', 'current', 'latest', 'status']
-            for word in data_question_words:
-                if word in query_lower:
-                    logger.info(f" Data question word '{word}' detected, classifying as data_query")
-                    return 'data_query'
+            keyword_intent = self._detect_intent_by_keywords(english_query, original_query)
+            if keyword_intent:
+                return keyword_intent
             
             prompt = f"""You are an expert intent classifier for agriculture AI assistant queries.
 
@@ -272,15 +393,10 @@ IMPORTANT: Agricultural sensor terms should ALWAYS be data_query:
 - "yield prediction" -> data_query (needs yield prediction sensor data)
 - "energy usage" -> data_query (needs energy usage sensor data)
 
-Intent:"""
-            
-            response = self.llm.invoke(prompt)
-            intent = response.content.strip().lower()
+Respond with a JSON object of the form {{"intent": "data_query"}} or {{"intent": "mixed"}}."""
             
-            # Validate intent
-            if intent not in ['data_query', 'mixed']:
-                logger.warning(f" Invalid intent detected: {intent}, defaulting to data_query")
-                intent = 'data_query'
+            response = self.llm_json.invoke(prompt)
+            intent = IntentDetection.model_validate_json(response.content).intent
             
             logger.info(f" Intent detected: {intent}")
             return intent
@@ -375,8 +491,14 @@ Persian:"""
             }
     
     
-    def _process_mixed_query(self, english_query: str, session_id: str, feature_context: str, is_comparison: bool = False) -> Dict[str, Any]:
-        """Process mixed query by splitting and merging results"""
+    def _process_mixed_query(self, english_query: str, session_id: str, feature_context: str, is_comparison: bool = False,
+                             stream_merge: bool = False, language: str = "en") -> Dict[str, Any]:
+        """Process mixed query by splitting and merging results
+        
+        With stream_merge=True the blocking merge call is skipped and the merge
+        prompt (asking for a reply in language) is returned instead, so the caller
+        can stream it via astream_merge_results.
+        """
         try:
             print(f" DEBUG: Starting mixed query processing for: {len(english_query)} characters (comparison: {is_comparison})")
             logger.info(f" Processing mixed query: '{english_query}' (comparison: {is_comparison})")
@@ -414,20 +536,25 @@ Persian:"""
                 print(f" DEBUG: No data parts extracted, skipping data processing")
                 logger.warning(f" DEBUG: No data parts extracted, skipping data processing")
             
-            # For mixed queries, we only process data parts
-            # Reasoning parts are handled by the LLM in the streaming endpoint
-            merged_response = self._merge_results(data_result, None, english_query)
-            
-            return {
+            result = {
                 "type": "mixed",
                 "success": True,
-                "response": merged_response,
                 "data": data_result.get("raw_data", []) if data_result else [],
                 "sql": data_result.get("sql", "") if data_result else "",
                 "metrics": data_result.get("metrics", {}) if data_result else {},
                 "validation": data_result.get("validation", {}) if data_result else {"query_valid": True, "execution_success": True}
             }
             
+            # For mixed queries, we only process data parts
+            # Reasoning parts are handled by the LLM in the streaming endpoint
+            if stream_merge:
+                result["response"] = self._merge_fallback(data_result, None)
+                result["merge_prompt"] = self._build_merge_prompt(data_result, None, english_query, language)
+            else:
+                result["response"] = self._merge_results(data_result, None, english_query)
+            
+            return result
+            
         except Exception as e:
             logger.error(f" Mixed Query Processing Error: {str(e)}")
             return {
@@ -613,24 +740,20 @@ Extract only the reasoning question (about actions/decisions):"""
                 "type": "reasoning"
             }
     
-    def _merge_results(self, data_result: Optional[Dict], reasoning_result: Optional[Dict], original_query: str) -> str:
-        """Merge data and reasoning results into a single response"""
-        try:
-            data_info = data_result.get("response", "") if data_result else ""
-            reasoning_info = reasoning_result.get("response", "") if reasoning_result else ""
-            raw_data = data_result.get("raw_data", []) if data_result else []
-            
-            # Format the actual sensor data for the LLM
-            sensor_data_text = ""
-            if raw_data:
-                sensor_data_text = "\n\n## Actual Sensor Data:\n"
-                for data_point in raw_data:
-                    sensor_type = data_point.get('sensor_type', 'unknown')
-                    value = data_point.get('value', 'N/A')
-                    timestamp = data_point.get('timestamp', 'N/A')
-                    sensor_data_text += f"- {sensor_type}: {value} (at {timestamp})\n"
-            
-            prompt = f"""You are an expert agricultural AI assistant. Provide concise, helpful responses.
+    def _build_merge_prompt(self, data_result: Optional[Dict], reasoning_result: Optional[Dict], original_query: str,
+                            language: Optional[str] = None) -> str:
+        """Build the LLM prompt that merges data and reasoning results (in language, when given)"""
+        data_info = data_result.get("response", "") if data_result else ""
+        reasoning_info = reasoning_result.get("response", "") if reasoning_result else ""
+        raw_data = data_result.get("raw_data", []) if data_result else []
+        language_instruction = _MERGE_LANGUAGE_INSTRUCTIONS.get(language, _DEFAULT_MERGE_LANGUAGE_INSTRUCTION)
+        
+        # Format the actual sensor data for the LLM
+        sensor_data_text = ""
+        if raw_data:
+            sensor_data_text = "\n\n## Actual Sensor Data:\n" + "".join(_format_data_point(data_point) for data_point in raw_data)
+        
+        return f"""You are an expert agricultural AI assistant. Provide concise, helpful responses.
 
 RESPONSE STRUCTURE:
 1. **Brief Summary** - 2 sentences maximum about the current situation
@@ -639,7 +762,7 @@ RESPONSE STRUCTURE:
 GUIDELINES:
 - Keep it short and to the point (2 sentences max)
 - Give quick insights about what the data shows
-- If user speaks Persian, reply in Persian; if English, reply in English
+- {language_instruction}
 - Use EXACT time range from the data provided below
 - NEVER use generic labels like "Last Hour", "Last 6 Hours", "Last 24 Hours", "Last Week"
 - NEVER use Persian generic labels like "آخرین ساعت", "آخرین ۶ ساعت", "آخرین ۲۴ ساعت", "آخرین هفته"
@@ -683,22 +806,54 @@ Reasoning response: {reasoning_info}
 IMPORTANT: Use the actual sensor data values above in your response. Make specific recommendations based on the real sensor readings. Don't give generic advice - base your recommendations on the actual data values provided.
 
 Merge these responses into a single structured response following the markdown format above:"""
+    
+    def _merge_fallback(self, data_result: Optional[Dict], reasoning_result: Optional[Dict]) -> str:
+        """Combine data and reasoning responses without the LLM"""
+        data_part = data_result.get("response", "") if data_result else ""
+        reasoning_part = reasoning_result.get("response", "") if reasoning_result else ""
+        return f"{data_part}\n\n{reasoning_part}".strip()
+    
+    def _merge_results(self, data_result: Optional[Dict], reasoning_result: Optional[Dict], original_query: str) -> str:
+        """Merge data and reasoning results into a single response"""
+        try:
+            prompt = self._build_merge_prompt(data_result, reasoning_result, original_query)
             
             response = self.llm.invoke(prompt)
             merged_response = response.content.strip()
             
             # Add intent information at the end
-            intent_text = " Mixed Query - Combined data analysis and conversation"
-            return f"{merged_response}\n\n---\n{intent_text}"
+            return f"{merged_response}{MIXED_QUERY_FOOTER}"
             
         except Exception as e:
             logger.error(f" Results Merging Error: {str(e)}")
             # Fallback: combine responses manually
-            data_part = data_info if data_result else ""
-            reasoning_part = reasoning_info if reasoning_result else ""
-            fallback_response = f"{data_part}\n\n{reasoning_part}".strip()
-            intent_text = " Mixed Query - Combined data analysis and conversation"
-            return f"{fallback_response}\n\n---\n{intent_text}"
+            return f"{self._merge_fallback(data_result, reasoning_result)}{MIXED_QUERY_FOOTER}"
+    
+    async def astream_merge_results(self, merge_prompt: str, fallback_response: str = "", language: str = "en"):
+        """Stream the merged mixed-query response token by token"""
+        try:
+            async for chunk in self.llm.astream(merge_prompt):
+                if chunk.content:
+                    yield chunk.content
+        except Exception as e:
+            logger.error(f" Results Merging Stream Error: {str(e)}")
+            # The fallback is the untranslated data response
+            if language == 'fa':
+                fallback_response = await asyncio.to_thread(self._translate_response_to_persian, fallback_response)
+            yield fallback_response
+        yield MIXED_QUERY_FOOTER
+    
+    def save_streamed_response(self, session_id: str, user_query: str, streamed_response: str, result: Dict[str, Any]):
+        """Save a streamed mixed-query answer to history once the stream has finished"""
+        self._save_conversation_history(
+            session_id=session_id,
+            user_query=user_query,
+            assistant_response=streamed_response,
+            sql_query=result.get('sql', ''),
+            semantic_json=(result.get('validation') or {}).get('semantic_json', {}),
+            metrics=result.get('metrics', {}),
+            chart_data=result.get('chart', {})
+        )
     
     def _save_conversation_history(self, session_id: str, user_query: str, assistant_response: str, 
                                  sql_query: str = None, semantic_json: Dict = None, 
@@ -729,21 +884,8 @@ Merge these responses into a single structured response following the markdown f
     def _get_conversation_context(self, session_id: str) -> str:
         """Get conversation history as context string from database"""
         try:
-            # Get context from database storage
-            context_data = self.session_storage.get_session_context(session_id, limit=5)
-            
-            if not context_data:
-                return ""
-            
-            # Format conversation history
-            context_lines = []
-            for item in context_data:
-                query = item['query'][:200] + "..." if len(item['query']) > 200 else item['query']
-                response = item['response'][:200] + "..." if len(item['response']) > 200 else item['response']
-                context_lines.append(f"User: {query}")
-                context_lines.append(f"Assistant: {response}")
-            
-            return "\n".join(context_lines)
+            # Compact records are stored pre-truncated and pre-formatted
+            return "\n".join(self.session_storage.get_context_records(session_id, limit=5))
             
         except Exception as e:
             logger.error(f" Error getting conversation context: {str(e)}")
@@ -773,8 +915,14 @@ Merge these responses into a single structured response following the markdown f
         """Get list of active sessions"""
         return self.session_storage.get_active_sessions()
     
-    def process_query(self, query: str, session_id: str = "default", feature_context: str = "dashboard") -> Dict[str, Any]:
-        """Main processing function following the complete intent routing flow"""
+    def process_query(self, query: str, session_id: str = "default", feature_context: str = "dashboard",
+                      stream_merge: bool = False) -> Dict[str, Any]:
+        """Main processing function following the complete intent routing flow
+        
+        stream_merge defers the mixed-query merge LLM call; the result then carries a
+        'merge_prompt' for the caller to stream instead of a merged response, and the caller
+        saves the streamed text with save_streamed_response.
+        """
         try:
             print(f"\n{'='*80}")
             print(f" INTENT ROUTER LAYER - NEW QUERY RECEIVED")
@@ -801,19 +949,8 @@ Merge these responses into a single structured response following the markdown f
             if is_comparison:
                 print(f"    This is a comparison query - will use comparison logic")
             
-            # Step 2: Translate if Persian
-            print(f"\n STEP 2: TRANSLATION")
-            english_query = query
-            if detected_lang == 'fa':
-                print(f"    Persian detected, translating...")
-                english_query = self._translate_query(query)
-                print(f"    Translated: {len(query)} -> {len(english_query)} characters")
-                logger.info(f" Translated to English: '{english_query}'")
-            else:
-                print(f"    English detected, no translation needed")
-            
-            # Step 3: Get conversation context
-            print(f"\n STEP 3: CONVERSATION CONTEXT")
+            # Step 2: Get conversation context
+            print(f"\n STEP 2: CONVERSATION CONTEXT")
             conversation_context = self._get_conversation_context(session_id)
             print(f"    Context Length: {len(conversation_context)} characters")
             if conversation_context:
@@ -824,10 +961,31 @@ Merge these responses into a single structured response following the markdown f
             else:
                 print(f"    No previous conversation")
             
-            # Step 4: Detect intent
-            print(f"\n STEP 4: INTENT DETECTION")
-            print(f"    Analyzing: {len(english_query)} characters")
-            intent = self._detect_intent(english_query, conversation_context, query)
+            # Steps 3-4: Translate and detect intent
+            english_query = query
+            intent = None
+            if detected_lang == 'fa':
+                # Persian: one structured LLM call translates and classifies together
+                print(f"\n STEP 3: TRANSLATION + CLASSIFICATION")
+                try:
+                    classification = self._classify_query(query, conversation_context)
+                    english_query = classification.english_query or query
+                    is_comparison = is_comparison or classification.is_comparison
+                    # Keyword rules stay authoritative over the LLM label
+                    intent = self._detect_intent_by_keywords(english_query, query) or classification.intent
+                except Exception as e:
+                    logger.error(f" Classification Error: {str(e)}, falling back to separate translation")
+                    english_query = self._translate_query(query)
+                print(f"    Translated: {len(query)} -> {len(english_query)} characters")
+                logger.info(f" Translated to English: '{english_query}'")
+            else:
+                print(f"\n STEP 3: TRANSLATION")
+                print(f"    English detected, no translation needed")
+            
+            if intent is None:
+                print(f"\n STEP 4: INTENT DETECTION")
+                print(f"    Analyzing: {len(english_query)} characters")
+                intent = self._detect_intent(english_query, conversation_context, query)
             print(f"    Detected Intent: {intent}")
             logger.info(f" Intent detected: {intent}")
             
@@ -839,7 +997,7 @@ Merge these responses into a single structured response following the markdown f
                 result = self._process_data_query(english_query, session_id, feature_context, is_comparison)
             elif intent == 'mixed':
                 print(f"    Processing as MIXED QUERY")
-                result = self._process_mixed_query(english_query, session_id, feature_context, is_comparison)
+                result = self._process_mixed_query(english_query, session_id, feature_context, is_comparison, stream_merge, detected_lang)
             elif intent == 'alert_management':
                 print(f"    Processing as ALERT MANAGEMENT")
                 result = self._process_alert_query(english_query, session_id, feature_context)
@@ -855,7 +1013,9 @@ Merge these responses into a single structured response following the markdown f
             
             # Step 6: Translate back to Persian if needed
             print(f"\n STEP 6: RESPONSE TRANSLATION")
-            if detected_lang == 'fa':
+            if result.get('merge_prompt'):
+                print(f"    Merge deferred to stream, which is prompted in the detected language")
+            elif detected_lang == 'fa':
                 print(f"    Translating response back to Persian...")
                 original_response = result['response']
                 result['response'] = self._translate_response_to_persian(result['response'])
@@ -875,16 +1035,19 @@ Merge these responses into a single structured response following the markdown f
             
             # Step 7: Save conversation history
             print(f"\n STEP 7: SAVE CONVERSATION")
-            self._save_conversation_history(
-                session_id=session_id, 
-                user_query=query, 
-                assistant_response=result['response'],
-                sql_query=result.get('sql', ''),
-                semantic_json=result.get('validation', {}).get('semantic_json', {}),
-                metrics=result.get('metrics', {}),
-                chart_data=result.get('chart', {})
-            )
-            print(f"    Conversation saved for session: {session_id}")
+            if result.get('merge_prompt'):
+                print(f"    Deferred until the merge stream finishes")
+            else:
+                self._save_conversation_history(
+                    session_id=session_id, 
+                    user_query=query, 
+                    assistant_response=result['response'],
+                    sql_query=result.get('sql', ''),
+                    semantic_json=result.get('validation', {}).get('semantic_json', {}),
+                    metrics=result.get('metrics', {}),
+                    chart_data=result.get('chart', {})
+                )
+                print(f"    Conversation saved for session: {session_id}")
             
             # Step 8: Convert to frontend-compatible format
             print(f"\n STEP 8: FRONTEND FORMATTING")
@@ -955,7 +1118,8 @@ Merge these responses into a single structured response following the markdown f
                 "metrics": result.get('metrics', {}),
                 "validation": result.get('validation', {}),
                 "chart": result.get('chart', None),  # Add chart data
-                "chart_type": result.get('chart_type', None)  # Add chart type
+                "chart_type": result.get('chart_type', None),  # Add chart type
+                "merge_prompt": result.get('merge_prompt', None)  # Deferred mixed-query merge
             }
             
         except Exception as e:
@@ -969,22 +1133,37 @@ Merge these responses into a single structured response following the markdown f
                 "validation": {"query_valid": False, "execution_success": False}
             }
     
-    def get_health_status(self) -> Dict[str, Any]:
-        """Get health status of the intent router layer"""
+    def get_health_status(self, deep: bool = False) -> Dict[str, Any]:
+        """Get health status of the intent router layer
+        
+        The default check is static and never calls the LLM. deep=True additionally runs
+        a synthetic query, at most once per HEALTH_DEEP_CHECK_INTERVAL seconds.
+        """
         try:
-            # Test basic functionality
-            test_result = self.process_query("test query", "health_test")
+            llm_available = self.llm is not None
+            storage_available = self.session_storage.ping()
+            language_detection_ok = self._detect_language("hello") == 'en'
             
-            return {
-                "status": "healthy",
+            status = {
+                "status": "healthy" if (llm_available and storage_available and language_detection_ok) else "unhealthy",
                 "timestamp": datetime.utcnow().isoformat(),
-                "llm_available": hasattr(self.llm, 'openai_api_key'),
+                "llm_available": llm_available,
+                "session_storage_available": storage_available,
+                "language_detection_ok": language_detection_ok,
                 "services_available": {
                     "unified_semantic_service": hasattr(self, 'unified_semantic_service')
                 },
-                "test_query_success": test_result.get("success", False),
                 "active_sessions": len(self.conversation_memories)
             }
+            
+            if deep:
+                now = time.monotonic()
+                if self._last_deep_check is None or now - self._last_deep_check[0] >= HEALTH_DEEP_CHECK_INTERVAL:
+                    test_result = self.process_query("test query", "health_test")
+                    self._last_deep_check = (now, test_result.get("success", False))
+                status["test_query_success"] = self._last_deep_check[1]
+            
+            return status
         except Exception as e:
             return {
                 "status": "unhealthy",
@@ -1,8 +1,9 @@
 import os
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 
 # LangChain imports
 from langchain.agents import initialize_agent, AgentType
@@ -17,6 +18,10 @@ from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
+# Live queries behind the data summary
+SAMPLE_QUERY = "SELECT * FROM sensor_data LIMIT 5"
+COUNT_QUERY = "SELECT COUNT(*) as total FROM sensor_data"
+
 class MockLLM:
     """Mock LLM for testing without OpenAI API"""
     
@@ -50,6 +55,8 @@ class LangChainOrchestrator:
         self.sql_db = None
         self.sql_toolkit = None
         self.python_tool = None
+        self._table_info = None
+        self._columns_cache = {}
         
     def setup_database_connection(self):
         """Setup SQL database connection for SQLDatabaseChain"""
@@ -61,6 +68,14 @@ class LangChainOrchestrator:
             engine = create_engine(database_url)
             self.sql_db = SQLDatabase(engine)
             self.sql_toolkit = SQLDatabaseToolkit(db=self.sql_db, llm=self.llm)
+            
+            # Reflect the schema once here instead of on every summary call
+            self._table_info = self.sql_db.get_table_info()
+            inspector = inspect(engine)
+            self._columns_cache = {
+                table: [column["name"] for column in inspector.get_columns(table)]
+                for table in self.sql_db.get_usable_table_names()
+            }
             logger.info(f"SQL database connection established: {database_url}")
         except Exception as e:
             logger.error(f"Error setting up database connection: {str(e)}")
@@ -188,31 +203,51 @@ ALWAYS USE TOOLS - NO GENERIC RESPONSES!"""
                 "success": False
             }
     
-    def get_data_summary(self) -> Dict[str, Any]:
-        """Get summary of database schema and data"""
+    def _summary(self, sample_data, total_count) -> Dict[str, Any]:
+        """Assemble the data summary from the live sample and count query results"""
+        return {
+            "table_info": self._table_info,
+            "sample_data": sample_data,
+            "total_count": total_count,
+            "columns": self._columns_cache.get("sensor_data", ["id", "timestamp", "sensor_type", "value"]),
+            "shape": [total_count, 4] if total_count else [0, 4]
+        }
+    
+    async def aget_data_summary(self) -> Dict[str, Any]:
+        """Get summary of database schema and data, running the live queries concurrently"""
         try:
             if self.sql_db is None:
                 return {"error": "Database not connected"}
             
-            # Get table info
-            table_info = self.sql_db.get_table_info()
+            # Table info is reflected once at connection time
+            if self._table_info is None:
+                self._table_info = await asyncio.to_thread(self.sql_db.get_table_info)
+            
+            # Sample data and count are independent, so overlap their round-trips
+            sample_data, total_count = await asyncio.gather(
+                asyncio.to_thread(self.sql_db.run, SAMPLE_QUERY),
+                asyncio.to_thread(self.sql_db.run, COUNT_QUERY)
+            )
+            return self._summary(sample_data, total_count)
             
-            # Get sample data
-            sample_query = "SELECT * FROM sensor_data LIMIT 5"
-            sample_data = self.sql_db.run(sample_query)
+        except Exception as e:
+            logger.error(f"Error getting data summary: {str(e)}")
+            return {"error": str(e)}
+    
+    def get_data_summary(self) -> Dict[str, Any]:
+        """Get summary of database schema and data"""
+        try:
+            if self.sql_db is None:
+                return {"error": "Database not connected"}
             
-            # Get count
-            count_query = "SELECT COUNT(*) as total FROM sensor_data"
-            total_count = self.sql_db.run(count_query)
+            # Table info is reflected once at connection time
+            if self._table_info is None:
+                self._table_info = self.sql_db.get_table_info()
             
-            return {
-                "table_info": table_info,
-                "sample_data": sample_data,
-                "total_count": total_count,
-                "columns": ["id", "timestamp", "sensor_type", "value"],
-                "shape": [total_count, 4] if total_count else [0, 4]
-            }
+            sample_data = self.sql_db.run(SAMPLE_QUERY)
+            total_count = self.sql_db.run(COUNT_QUERY)
+            return self._summary(sample_data, total_count)
             
         except Exception as e:
             logger.error(f"Error getting data summary: {str(e)}")
-            return {"error": str(e)}
\ No newline at end of file
+            return {"error": str(e)}
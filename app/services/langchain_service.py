@@ -1,120 +1,415 @@
 import os
+import re
+import asyncio
+import time
+import hashlib
+import sqlite3
+import threading
+import numpy as np
 import pandas as pd
+import httpx
 import plotly.graph_objects as go
-import plotly.express as px
-from typing import Dict, List, Any, Optional, ClassVar
+import plotly.io as pio
+from typing import Dict, List, Any, Optional, Tuple, AsyncIterator, ClassVar
 import logging
 from datetime import datetime
+from collections import OrderedDict
+from string import Template
 import json
 import base64
 import io
 
 # LangChain imports
 from langchain_community.llms import OpenAI
-from langchain.agents import initialize_agent, Tool, AgentType
-from langchain_community.agent_toolkits.sql.base import create_sql_agent
-from langchain.tools import BaseTool, tool
-from langchain.schema import AgentAction, AgentFinish
-from langchain.callbacks.manager import CallbackManagerForToolRun
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
-from langchain_experimental.tools import PythonREPLTool
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 
 logger = logging.getLogger(__name__)
 
-class DataAnalysisTool(BaseTool):
-    """Tool for analyzing data using pandas operations"""
+# Persian analysis instructions, kept byte-identical across calls so the provider can cache the prompt prefix
+ANALYSIS_INSTRUCTIONS = """شما یک تحلیلگر داده هوشمند هستید که باید به زبان فارسی پاسخ دهید. لطفاً تحلیل دقیق و ساختاریافته از داده‌های سنسور ارائه دهید.
+
+الزامات پاسخ:
+1. حتماً به زبان فارسی پاسخ دهید
+2. پاسخ را با بولت پوینت ساختاریافته ارائه دهید
+3. فقط بر اساس داده‌های واقعی موجود تحلیل کنید
+4. مقادیر دقیق و آمار را ذکر کنید
+5. الگوها و روندها را شناسایی کنید
+6. نتیجه‌گیری عملی ارائه دهید
+
+فرمت پاسخ مورد نظر:
+پاسخ طبیعی و دوستانه ارائه دهید که شامل:
+1. پاسخ طبیعی و گفتگویی درباره داده‌ها
+2. بخش داده‌های ساختاریافته با فرمت:
+```
+📊 داده‌های سنسور بر اساس بازه زمانی:
+• نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین ساعت)
+• نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین 6 ساعت)
+• نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین 24 ساعت)
+• نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین هفته)
+```
+3. بخش تحلیل با فرمت:
+```
+🔍 تحلیل:
+• روند: [توصیف روند - افزایش، کاهش، ثابت]
+• الگو: [شناسایی الگوهای موجود در داده‌ها]
+• اهمیت: [این داده‌ها برای مزرعه چه معنایی دارد]
+• سطح هشدار: [پایین/متوسط/بالا بر اساس داده‌ها]
+```
+4. بخش توصیه‌ها با فرمت:
+```
+💡 توصیه‌ها:
+• اقدامات فوری: [چه کاری باید همین الان انجام داد]
+• نظارت: [چه چیزی را باید زیر نظر داشت]
+• بلندمدت: [توصیه‌های استراتژیک برای آینده]
+• منابع: [ابزارها یا روش‌های قابل استفاده]
+```
+
+فقط بر اساس داده‌های موجود تحلیل کنید و مقادیر دقیق را ذکر کنید."""
+
+USER_QUESTION_PREFIX = "سوال کاربر: "
+
+_CONTEXT_CLOSING = "این داده‌ها نشان‌دهنده قرائت‌های سنسور در زمان واقعی هستند. لطفاً این مجموعه داده جامع را تحلیل کنید تا به سوالات کاربر با بینش‌های خاص، آمار و الگوها پاسخ دهید."
+
+# Data context layouts, filled once per load by _create_data_context
+DATA_CONTEXT_TEMPLATE = Template("""CONTEXT تحلیل داده‌های سنسور:
+
+نمای کلی مجموعه داده:
+- تعداد کل رکوردها: $row_count
+- ستون‌ها: $columns
+- انواع داده: $dtypes
+- مقادیر گمشده: $null_counts
+
+خلاصه آماری:
+$stats_summary
+
+تحلیل سنسور بر اساس نوع:
+$sensor_analysis
+
+آمار سنسور بر اساس بازه زمانی (1h/6h/24h/7d تا آخرین قرائت):
+$window_analysis
+
+آخرین 10 قرائت (JSON):
+$latest_readings
+
+نمونه کامل مجموعه داده (20 رکورد اول):
+$sample_records
+
+""" + _CONTEXT_CLOSING)
+
+SMALL_DATA_CONTEXT_TEMPLATE = Template("""CONTEXT تحلیل داده‌های سنسور:
+
+نمای کلی مجموعه داده:
+- تعداد کل رکوردها: $row_count
+- ستون‌ها: $columns
+- انواع داده: $dtypes
+
+همه رکوردها (JSON):
+$records
+
+""" + _CONTEXT_CLOSING)
+
+_MOCK_ANALYSIS_TEMPLATE = {"success": True, "response": None, "timestamp": None}
+
+# Keep-alive pool for the OpenAI-compatible API; reused connections skip TCP/TLS setup per call
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60)
+
+# Persistent answer cache (opt-in via ANSWER_CACHE_DB): rows older than this are ignored and
+# dropped at startup, and similarity lookups scan at most this many recent rows per scope
+ANSWER_CACHE_TTL = 24 * 3600
+ANSWER_CACHE_SCAN_LIMIT = 1000
+
+# Largest cosine distance at which a cached answer is reused for a reworded question
+ANSWER_CACHE_MAX_DISTANCE = 0.05
+
+# Query slots that must match before a near-duplicate answer is reused: embeddings put
+# "max temperature today" right next to "min temperature today"
+_AGGREGATION_SLOTS = tuple((slot, re.compile(pattern)) for slot, pattern in (
+    ("max", r"\b(?:max|maximum|highest|peak|بیشترین|حداکثر|بالاترین)\b"),
+    ("min", r"\b(?:min|minimum|lowest|کمترین|حداقل)\b"),
+    ("avg", r"\b(?:average|avg|mean|میانگین)\b"),
+    ("sum", r"\b(?:sum|total|مجموع)\b"),
+    ("count", r"\b(?:count|how many|تعداد)\b"),
+    ("trend", r"\b(?:trend|trends|روند)\b"),
+))
+_TIME_SLOTS = tuple((slot, re.compile(pattern)) for slot, pattern in (
+    ("now", r"\b(?:now|current|currently|latest|الان|فعلی)\b"),
+    ("today", r"\b(?:today|امروز)\b"),
+    ("yesterday", r"\b(?:yesterday|دیروز)\b"),
+    ("hour", r"\b(?:hour|hours|hourly|ساعت)\b"),
+    ("day", r"\b(?:day|days|daily|روز)\b"),
+    ("week", r"\b(?:week|weeks|weekly|هفته)\b"),
+    ("month", r"\b(?:month|months|monthly|ماه)\b"),
+))
+_NUMBER_RE = re.compile(r"\d+")
+
+def _query_slots(query: str, sensors: List[str]) -> tuple:
+    """(sensors, aggregations, time words and numbers) a query mentions, for cache scoping"""
+    text = query.lower()
+    entities = tuple(sensor for sensor in sensors if sensor in text or sensor.replace('_', ' ') in text)
+    aggregations = tuple(slot for slot, pattern in _AGGREGATION_SLOTS if pattern.search(text))
+    time_range = tuple(slot for slot, pattern in _TIME_SLOTS if pattern.search(text))
+    return entities, aggregations, time_range + tuple(int(n) for n in _NUMBER_RE.findall(text))
+
+# Upper bound on concurrent LLM requests from one service instance (provider rate limits)
+MAX_CONCURRENT_LLM_CALLS = 8
+
+_EMPTY_CONTEXT = "No data available for analysis."
+
+# Below this many rows the context inlines every record instead of aggregate statistics
+SMALL_CONTEXT_ROWS = 50
+
+def _records_json(df: pd.DataFrame) -> str:
+    """Serialize DataFrame rows as a JSON array of records in pandas' C writer (no per-row dicts)"""
+    return df.to_json(orient='records', date_format='iso', force_ascii=False)
+
+def _group_stats(codes: np.ndarray, values: np.ndarray, n_groups: int) -> tuple:
+    """Per-group (count, min, max, mean, std) of values over contiguous int32 group codes
+    
+    std is the sample standard deviation (ddof=1), matching pandas.
+    """
+    # Sums via bincount, extrema via reduceat over the values sorted by group code
+    count = np.bincount(codes, minlength=n_groups)
+    total = np.bincount(codes, weights=values, minlength=n_groups)
+    total_sq = np.bincount(codes, weights=values * values, minlength=n_groups)
+    order = np.argsort(codes, kind='stable')
+    sorted_values = values[order]
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    present = count > 0
+    minimum = np.full(n_groups, np.nan)
+    maximum = np.full(n_groups, np.nan)
+    minimum[present] = np.minimum.reduceat(sorted_values, starts[present])
+    maximum[present] = np.maximum.reduceat(sorted_values, starts[present])
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = (total_sq - total * mean) / (count - 1)
+        std = np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+    
+    return count, minimum, maximum, mean, std
+
+# Trailing windows reported per sensor in the analysis context (the prompt's 1h/6h/24h/week buckets)
+STAT_WINDOWS = (('1h', 3600), ('6h', 6 * 3600), ('24h', 24 * 3600), ('7d', 7 * 24 * 3600))
+
+def _window_stats(ages: np.ndarray, values: np.ndarray, codes: np.ndarray, n_groups: int, edges: np.ndarray) -> tuple:
+    """Per-group (count, min, max, mean) of values over nested trailing windows, shape (n_groups, len(edges))
     
-    name: str = "data_analysis"
-    description: str = "Analyze data using pandas operations. Input should be a pandas operation string."
+    ages are row ages in the unit of edges (ascending window lengths). Each row is binned once
+    into the smallest window containing it; larger windows accumulate the smaller ones.
+    """
+    n_windows = len(edges)
+    bucket = np.searchsorted(edges, ages, side='left')
+    keep = (bucket < n_windows) & (codes >= 0) & ~np.isnan(values)
+    cell = codes[keep].astype(np.int64) * n_windows + bucket[keep]
+    kept = values[keep]
+    count, minimum, maximum, mean, _ = _group_stats(cell, kept, n_groups * n_windows)
+    shape = (n_groups, n_windows)
+    count = np.cumsum(count.reshape(shape), axis=1)
+    total = np.cumsum(np.bincount(cell, weights=kept, minlength=n_groups * n_windows).reshape(shape), axis=1)
+    minimum = np.fmin.accumulate(minimum.reshape(shape), axis=1)
+    maximum = np.fmax.accumulate(maximum.reshape(shape), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return count, minimum, maximum, mean
+
+# Line/scatter series longer than this are min-max downsampled before plotting
+MAX_CHART_POINTS = 5000
+
+def _minmax_downsample(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Row indices keeping each bucket's min and max of y, in original order (preserves peaks)"""
+    n = len(y)
+    bucket = -(-n // max(n_out // 2, 1))
+    n_buckets = -(-n // bucket)
+    padded = np.full(n_buckets * bucket, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, bucket)
+    nan = np.isnan(padded)
+    offsets = np.arange(n_buckets) * bucket
+    lows = offsets + np.where(nan, np.inf, padded).argmin(axis=1)
+    highs = offsets + np.where(nan, -np.inf, padded).argmax(axis=1)
+    indices = np.union1d(lows, highs)
+    return indices[indices < n]
+
+# Shared chart skeleton; go.Figure copies it, so per-call titles never leak between charts
+_CHART_LAYOUT = go.Layout(template='plotly')
+
+# chart_type -> (trace factory, title format); line/scatter use WebGL traces
+_CHART_KINDS = {
+    'line': (lambda x, y: go.Scattergl(x=x, y=y, mode='lines'), "Line Chart: {x} vs {y}"),
+    'bar': (lambda x, y: go.Bar(x=x, y=y), "Bar Chart: {x} vs {y}"),
+    'scatter': (lambda x, y: go.Scattergl(x=x, y=y, mode='markers'), "Scatter Plot: {x} vs {y}"),
+    'histogram': (lambda x, y: go.Histogram(x=x, nbinsx=min(100, max(10, int(np.sqrt(len(x)))))), "Histogram: {x}"),
+}
+
+def _make_figure(df: pd.DataFrame, chart_type: str, columns: List[str]) -> Optional[go.Figure]:
+    """Build a chart from df columns; returns None for unsupported chart types"""
+    kind = _CHART_KINDS.get(chart_type.lower())
+    if kind is None:
+        return None
+    make_trace, title = kind
+    x_col = columns[0]
+    y_col = columns[1] if len(columns) > 1 and chart_type.lower() != 'histogram' else None
     
-    def __init__(self, df: pd.DataFrame):
-        super().__init__()
-        self.df = df
+    if y_col and len(df) > MAX_CHART_POINTS and pd.api.types.is_numeric_dtype(df[y_col]):
+        df = df.iloc[_minmax_downsample(df[y_col].to_numpy(dtype=np.float64), MAX_CHART_POINTS)]
     
-    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+    fig = go.Figure(data=[make_trace(df[x_col], df[y_col] if y_col else None)], layout=_CHART_LAYOUT)
+    fig.update_layout(title=title.format(x=x_col, y=y_col), xaxis_title=x_col, yaxis_title=y_col or "count")
+    return fig
+
+def _as_is(values: list) -> list:
+    return values
+
+# Column constructors for load_data_from_db; other columns are left to pandas' inference
+_LOAD_COLUMN_TYPES = {
+    'timestamp': lambda values: pd.to_datetime(values, format='ISO8601', cache=True),
+    # Kept float64: float32 readings print as 23.700000762939453 in summaries and prompts
+    'value': lambda values: np.asarray(values, dtype=np.float64),
+    # Low-cardinality sensor names: store as packed category codes
+    'sensor_type': pd.Categorical,
+}
+
+class SemanticCache:
+    """Bounded LRU cache of analysis responses keyed by query and scope
+    
+    The scope is the data fingerprint plus the query's slots, so answers are only shared
+    between questions over the same data about the same sensors, aggregation and time range.
+    Exact repeats hit a sha1 key; near-duplicate questions within a scope hit when the cosine
+    distance between query embeddings is below the threshold. With a db_path, entries are also
+    persisted to SQLite so answers survive worker restarts and are shared between workers.
+    """
+    
+    def __init__(self, max_entries: int = 256, distance_threshold: float = ANSWER_CACHE_MAX_DISTANCE,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.distance_threshold = distance_threshold
+        self.db_path = db_path
+        self._entries = OrderedDict()  # (fingerprint, sha1) -> (unit embedding or None, response)
+        self._lock = threading.Lock()
+        if self.db_path:
+            self._init_db()
+    
+    def _init_db(self):
+        """Create the answers table and drop rows older than ANSWER_CACHE_TTL"""
         try:
-            # Execute pandas operations safely
-            result = eval(f"self.df.{query}")
-            return str(result)
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS answers (
+                    df_fp TEXT NOT NULL,
+                    query_hash TEXT NOT NULL,
+                    embedding BLOB,
+                    response TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    PRIMARY KEY (df_fp, query_hash)
+                )
+            ''')
+            conn.execute('DELETE FROM answers WHERE ts < ?', (int(time.time()) - ANSWER_CACHE_TTL,))
+            conn.commit()
+            conn.close()
         except Exception as e:
-            return f"Error in data analysis: {str(e)}"
-
-class VisualizationTool(BaseTool):
-    """Tool for creating visualizations"""
+            logger.warning(f"Answer cache database unavailable, using memory only: {str(e)}")
+            self.db_path = None
+    
+    @staticmethod
+    def _key(query: str, scope: tuple) -> tuple:
+        return scope, hashlib.sha1(query.strip().lower().encode('utf-8')).hexdigest()
     
-    name: str = "create_visualization"
-    description: str = "Create visualizations (line, bar, scatter, histogram). Input format: 'chart_type:column1,column2'"
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
     
-    def __init__(self, df: pd.DataFrame):
-        super().__init__()
-        self.df = df
-        self.chart_count = 0
+    def _remember(self, key: tuple, vector: Optional[np.ndarray], response: str):
+        """Insert into the in-memory tier, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (vector, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
     
-    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+    def _db_rows(self, sql: str, params: tuple) -> list:
+        if not self.db_path:
+            return []
         try:
-            self.chart_count += 1
-            chart_type, columns = query.split(':')
-            columns = [col.strip() for col in columns.split(',')]
-            
-            # Create visualization based on type
-            if chart_type.lower() == 'line':
-                fig = px.line(self.df, x=columns[0], y=columns[1], title=f"Line Chart: {columns[0]} vs {columns[1]}")
-            elif chart_type.lower() == 'bar':
-                fig = px.bar(self.df, x=columns[0], y=columns[1], title=f"Bar Chart: {columns[0]} vs {columns[1]}")
-            elif chart_type.lower() == 'scatter':
-                fig = px.scatter(self.df, x=columns[0], y=columns[1], title=f"Scatter Plot: {columns[0]} vs {columns[1]}")
-            elif chart_type.lower() == 'histogram':
-                fig = px.histogram(self.df, x=columns[0], title=f"Histogram: {columns[0]}")
-            else:
-                return "Unsupported chart type. Use: line, bar, scatter, histogram"
-            
-            # Convert to base64 for web display
-            chart_html = fig.to_html(include_plotlyjs='cdn')
-            return f"Visualization created: {chart_type} chart"
-            
+            conn = sqlite3.connect(self.db_path)
+            rows = conn.execute(sql, params).fetchall()
+            conn.close()
+            return rows
         except Exception as e:
-            return f"Error creating visualization: {str(e)}"
-
-class DataInsightTool(BaseTool):
-    """Tool for generating data insights using LLM"""
+            logger.warning(f"Answer cache read failed: {str(e)}")
+            return []
     
-    name: str = "data_insights"
-    description: str = "Generate insights about the data using natural language analysis"
+    def get(self, query: str, scope: tuple) -> Optional[str]:
+        """Return the cached response for an identical query, if any"""
+        key = self._key(query, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+        
+        rows = self._db_rows(
+            'SELECT embedding, response FROM answers WHERE df_fp = ? AND query_hash = ? AND ts >= ?',
+            (repr(scope), key[1], int(time.time()) - ANSWER_CACHE_TTL)
+        )
+        if not rows:
+            return None
+        embedding, response = rows[0]
+        self._remember(key, np.frombuffer(embedding, dtype=np.float32) if embedding else None, response)
+        return response
     
-    def __init__(self, df: pd.DataFrame, llm):
-        super().__init__()
-        self.df = df
-        self.llm = llm
+    def get_similar(self, embedding: List[float], scope: tuple) -> Optional[str]:
+        """Return the response of the nearest cached query in scope within the distance threshold"""
+        query_vector = self._unit(embedding)
+        with self._lock:
+            candidates = [(key, entry[0], entry[1]) for key, entry in self._entries.items()
+                          if key[0] == scope and entry[0] is not None]
+        if self.db_path:
+            in_memory = {key for key, _, _ in candidates}
+            for query_hash, blob, response in self._db_rows(
+                'SELECT query_hash, embedding, response FROM answers '
+                'WHERE df_fp = ? AND embedding IS NOT NULL AND ts >= ? ORDER BY ts DESC LIMIT ?',
+                (repr(scope), int(time.time()) - ANSWER_CACHE_TTL, ANSWER_CACHE_SCAN_LIMIT)
+            ):
+                key = (scope, query_hash)
+                if key not in in_memory:
+                    candidates.append((key, np.frombuffer(blob, dtype=np.float32), response))
+        if not candidates:
+            return None
+        
+        distances = 1.0 - np.stack([vector for _, vector, _ in candidates]) @ query_vector
+        best = int(np.argmin(distances))
+        if distances[best] >= self.distance_threshold:
+            return None
+        key, vector, response = candidates[best]
+        self._remember(key, vector, response)
+        return response
     
-    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+    def put(self, query: str, scope: tuple, response: str, embedding: Optional[List[float]] = None):
+        """Store a response in memory and, when configured, in the answers table"""
+        vector = self._unit(embedding) if embedding is not None else None
+        key = self._key(query, scope)
+        self._remember(key, vector, response)
+        if not self.db_path:
+            return
         try:
-            # Get basic data info
-            data_info = f"""
-            Dataset shape: {self.df.shape}
-            Columns: {list(self.df.columns)}
-            Data types: {self.df.dtypes.to_dict()}
-            Sample data: {self.df.head().to_string()}
-            """
-            
-            # Create prompt for LLM
-            prompt = f"""
-            Based on the following dataset information:
-            {data_info}
-            
-            User question: {query}
-            
-            Please provide a detailed analysis and insights about the data.
-            """
-            
-            response = self.llm(prompt)
-            return response
-            
+            conn = sqlite3.connect(self.db_path)
+            conn.execute(
+                'INSERT OR REPLACE INTO answers (df_fp, query_hash, embedding, response, ts) VALUES (?, ?, ?, ?, ?)',
+                (repr(scope), key[1], vector.tobytes() if vector is not None else None, response, int(time.time()))
+            )
+            conn.commit()
+            conn.close()
         except Exception as e:
-            return f"Error generating insights: {str(e)}"
+            logger.warning(f"Answer cache write failed: {str(e)}")
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
 class MockLLM:
     """Mock LLM for testing without OpenAI API"""
@@ -124,6 +419,9 @@ class MockLLM:
 
 class LangChainService:
     """Service for LangChain-based data analysis with orchestrator pattern"""
+    
+    # SQLAlchemy engines are thread-safe pools; share one per database URL
+    _ENGINE_CACHE: ClassVar[Dict[str, Engine]] = {}
 
     def __init__(self):
         # Initialize LLM with custom API endpoint
@@ -131,6 +429,10 @@ class LangChainService:
         self.base_url = os.getenv('OPENAI_BASE_URL', 'https://ai.liara.ir/api/v1/688a24a93d0c49e74e362a7f')
         self.model_name = os.getenv('OPENAI_MODEL', 'openai/gpt-4o-mini')
 
+        # One keep-alive connection pool per service, shared by the chat and embedding clients
+        self._http_client = httpx.Client(limits=HTTP_LIMITS)
+        self._http_async_client = httpx.AsyncClient(limits=HTTP_LIMITS)
+
         if not self.api_key:
             logger.warning("No API key provided. Using mock LLM.")
             self.llm = MockLLM()
@@ -140,13 +442,47 @@ class LangChainService:
                 openai_api_key=self.api_key,
                 openai_api_base=self.base_url,
                 model_name=self.model_name,
-                temperature=0.7
+                temperature=0.7,
+                http_client=self._http_client,
+                http_async_client=self._http_async_client
             )
             logger.info(f"Using custom AI API: {self.base_url} with model {self.model_name}")
 
+        self._is_mock = isinstance(self.llm, MockLLM)
+        
+        # Embeddings back the semantic answer cache; without them only exact repeats hit
+        self.embeddings = None
+        if not self._is_mock:
+            self.embeddings = OpenAIEmbeddings(
+                openai_api_key=self.api_key,
+                openai_api_base=self.base_url,
+                model=os.getenv('OPENAI_EMBEDDING_MODEL', 'openai/text-embedding-3-small'),
+                http_client=self._http_client,
+                http_async_client=self._http_async_client
+            )
+        # Memory only unless ANSWER_CACHE_DB names a SQLite file to persist answers in
+        self.response_cache = SemanticCache(db_path=os.getenv('ANSWER_CACHE_DB'))
+        self._llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+        
         self.df = None
-        self.agent = None
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="output")
+        self._loaded_rows = None  # records behind self.df, to recognise an unchanged reload
+        self._context_cache = None  # rendered data context, valid until the next load
+        self._fingerprint = None
+        self._stats_cache = None
+        self._window_stats_cache = None
+        self._chart_cache = {}
+        self._summary_stats = None
+        self._describe = None
+        self._numeric_summary_cache = None
+        self._system_message = None
+        self._system_message_context = None
+        # Column views prepared once per load (see _prepare_views)
+        self._value = None
+        self._sensor_codes = None
+        self._sensor_uniq = None
+        self._numeric_cols = ()
+        self._dtypes_dict = {}
+        self._null_counts = {}
         self.sql_db = None
         self.sql_toolkit = None
         self.python_tool = None
@@ -157,8 +493,11 @@ class LangChainService:
             # Use SQLite database file
             db_path = "sensor_data.db"
             if os.path.exists(db_path):
-                # Create SQLAlchemy engine
-                engine = create_engine(f"sqlite:///{db_path}")
+                # Create SQLAlchemy engine (once per database URL)
+                database_url = f"sqlite:///{db_path}"
+                engine = self._ENGINE_CACHE.get(database_url)
+                if engine is None:
+                    engine = self._ENGINE_CACHE[database_url] = create_engine(database_url)
                 self.sql_db = SQLDatabase(engine)
                 self.sql_toolkit = SQLDatabaseToolkit(db=self.sql_db, llm=self.llm)
                 logger.info("SQL database connection established")
@@ -174,12 +513,27 @@ class LangChainService:
                 logger.error("No data provided")
                 return False
             
-            # Convert to DataFrame
-            self.df = pd.DataFrame(db_data)
-            
-            # Convert timestamp to datetime if it exists
-            if 'timestamp' in self.df.columns:
-                self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
+            # Endpoints reload the latest rows on every request; when they are unchanged, keep
+            # the frame and everything cached from it (the fingerprint hash included)
+            if self.df is not None and db_data == self._loaded_rows:
+                return True
+            
+            # Build typed columns directly rather than inferring object columns and converting them
+            self.df = pd.DataFrame({
+                key: _LOAD_COLUMN_TYPES.get(key, _as_is)([record[key] for record in db_data])
+                for key in db_data[0]
+            })
+            self._context_cache = None
+            self._fingerprint = None
+            self._stats_cache = None
+            self._window_stats_cache = None
+            self._chart_cache = {}
+            self._summary_stats = None
+            self._describe = None
+            self._numeric_summary_cache = None
+            
+            self._prepare_views()
+            self._loaded_rows = db_data
             
             logger.info(f"Data loaded successfully. Shape: {self.df.shape}")
             return True
@@ -188,223 +542,140 @@ class LangChainService:
             logger.error(f"Error loading data: {str(e)}")
             return False
     
-    def create_agent(self):
-        """Create LangChain agent with tools"""
+    def _prepare_views(self):
+        """Extract the column arrays and metadata that analysis reuses until the next load"""
+        self._numeric_cols = tuple(self.df.select_dtypes(include=['number']).columns)
+        self._dtypes_dict = self.df.dtypes.astype(str).to_dict()
+        self._null_counts = self.df.isnull().sum().to_dict()
+        self._value = self.df['value'].to_numpy(dtype=np.float64) if 'value' in self.df.columns else None
+        if 'sensor_type' in self.df.columns:
+            self._sensor_codes, self._sensor_uniq = pd.factorize(self.df['sensor_type'])
+        else:
+            self._sensor_codes, self._sensor_uniq = None, None
+    
+    def _precheck_analysis(self, query: str) -> Optional[Dict[str, Any]]:
+        """Return an immediate result when analysis cannot or need not call the LLM"""
         if self.df is None:
-            raise ValueError("No data loaded. Please load data first.")
+            return {
+                "success": False,
+                "error": "No data loaded",
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        
+        # For mock LLM, provide a simple response
+        if self._is_mock:
+            result = _MOCK_ANALYSIS_TEMPLATE.copy()
+            result["response"] = f"Mock analysis for query: '{query}'. Data shape: {self.df.shape}. This is a mock response - add your OpenAI API key for real analysis."
+            result["timestamp"] = datetime.utcnow().isoformat()
+            return result
+        
+        return None
+    
+    def _build_analysis_messages(self, query: str) -> List:
+        """Build the chat messages for an analysis request"""
+        # Create comprehensive data context automatically
+        data_context = self._create_data_context()
+        
+        # Static instructions lead the system message so the cached prefix survives data reloads;
+        # the message is rebuilt only when the cached context string changes
+        if self._system_message is None or self._system_message_context is not data_context:
+            self._system_message = SystemMessage(content=f"{ANALYSIS_INSTRUCTIONS}\n\n{data_context}")
+            self._system_message_context = data_context
         
+        # Only the human message varies per query
+        return [self._system_message, HumanMessage(content=USER_QUESTION_PREFIX + query)]
+    
+    def _analysis_snapshot(self, query: str) -> Tuple[List, tuple]:
+        """Chat messages and response cache scope for query, both taken from the data loaded now"""
+        return self._build_analysis_messages(query), self._cache_scope(query)
+    
+    def _analysis_result(self, response) -> Dict[str, Any]:
+        """Wrap an LLM response as an analysis result"""
+        # Extract the response content
+        if hasattr(response, 'content'):
+            response_text = response.content
+        else:
+            response_text = str(response)
+        
+        return {
+            "success": True,
+            "response": response_text,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    def _embed_query(self, query: str) -> Optional[List[float]]:
+        """Embed a query for the semantic cache; None when embeddings are unavailable"""
+        if self.embeddings is None:
+            return None
         try:
-            # Create tools using @tool decorator
-            @tool
-            def data_analysis(query: str) -> str:
-                """Analyze data using pandas operations. Input should be a pandas operation string."""
-                try:
-                    result = eval(f"self.df.{query}")
-                    return str(result)
-                except Exception as e:
-                    return f"Error in data analysis: {str(e)}"
-            
-            @tool
-            def create_visualization(query: str) -> str:
-                """Create visualizations (line, bar, scatter, histogram). Input format: 'chart_type:column1,column2'"""
-                try:
-                    chart_type, columns = query.split(':')
-                    columns = [col.strip() for col in columns.split(',')]
-                    
-                    if chart_type.lower() == 'line':
-                        fig = px.line(self.df, x=columns[0], y=columns[1], title=f"Line Chart: {columns[0]} vs {columns[1]}")
-                    elif chart_type.lower() == 'bar':
-                        fig = px.bar(self.df, x=columns[0], y=columns[1], title=f"Bar Chart: {columns[0]} vs {columns[1]}")
-                    elif chart_type.lower() == 'scatter':
-                        fig = px.scatter(self.df, x=columns[0], y=columns[1], title=f"Scatter Plot: {columns[0]} vs {columns[1]}")
-                    elif chart_type.lower() == 'histogram':
-                        fig = px.histogram(self.df, x=columns[0], title=f"Histogram: {columns[0]}")
-                    else:
-                        return "Unsupported chart type. Use: line, bar, scatter, histogram"
-                    
-                    return f"Visualization created: {chart_type} chart"
-                except Exception as e:
-                    return f"Error creating visualization: {str(e)}"
-            
-            @tool
-            def data_insights(query: str) -> str:
-                """Generate insights about the data using natural language analysis"""
-                try:
-                    # Get basic statistics
-                    numeric_cols = self.df.select_dtypes(include=['number']).columns
-                    stats_info = ""
-                    if len(numeric_cols) > 0:
-                        stats_info = f"\nStatistical Summary:\n{self.df[numeric_cols].describe().to_string()}"
-                    
-                    # Get data info
-                    data_info = f"""
-                    Dataset Overview:
-                    - Shape: {self.df.shape[0]} rows, {self.df.shape[1]} columns
-                    - Columns: {list(self.df.columns)}
-                    - Data types: {dict(self.df.dtypes)}
-                    - Missing values: {self.df.isnull().sum().to_dict()}
-                    
-                    Sample Data (first 5 rows):
-                    {self.df.head().to_string()}
-                    {stats_info}
-                    """
-                    
-                    prompt = f"""
-                    You are analyzing sensor data. Here's the dataset information:
-                    {data_info}
-                    
-                    User question: {query}
-                    
-                    Please provide a detailed analysis and insights about this sensor data. Focus on:
-                    1. Data patterns and trends
-                    2. Statistical insights
-                    3. Any anomalies or interesting observations
-                    4. Practical implications of the data
-                    
-                    Be specific and reference actual values from the data when possible.
-                    """
-                    
-                    response = self.llm.invoke(prompt)
-                    return response.content if hasattr(response, 'content') else str(response)
-                except Exception as e:
-                    return f"Error generating insights: {str(e)}"
-            
-            # Create agent with better system prompt
-            tools = [data_analysis, create_visualization, data_insights]
-            
-            # Create a more direct approach - use the data_insights tool directly
-            # Instead of complex agent, let's create a simpler approach that always uses data_insights
-            
-            # Create a custom prompt template that includes the data
-            data_context = f"""
-            You are analyzing sensor data with the following comprehensive information:
-            
-            Dataset Overview:
-            - Shape: {self.df.shape[0]} rows, {self.df.shape[1]} columns
-            - Columns: {list(self.df.columns)}
-            - Data types: {dict(self.df.dtypes)}
-            - Missing values: {self.df.isnull().sum().to_dict()}
-            
-            Sample Data (first 10 rows):
-            {self.df.head(10).to_string()}
-            
-            Latest Data (last 5 rows):
-            {self.df.tail(5).to_string()}
-            
-            Statistical Summary:
-            {self.df.describe().to_string() if len(self.df.select_dtypes(include=['number']).columns) > 0 else 'No numeric columns'}
-            
-            Sensor Types and Counts:
-            {self.df['sensor_type'].value_counts().to_string() if 'sensor_type' in self.df.columns else 'No sensor_type column'}
-            
-            Value Ranges by Sensor Type:
-            {self.df.groupby('sensor_type')['value'].agg(['min', 'max', 'mean', 'count']).to_string() if 'sensor_type' in self.df.columns and 'value' in self.df.columns else 'No sensor_type or value columns'}
-            
-            Please analyze this data and provide insights based on the user's question.
-            """
-            
-            # Store the data context for use in analysis
-            self.data_context = data_context
-            
-            # Create a simple agent that will use data_insights tool
-            self.agent = initialize_agent(
-                tools=tools,
-                llm=self.llm,
-                agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-                memory=self.memory,
-                verbose=False,  # Reduce verbosity
-                handle_parsing_errors=True,
-                max_iterations=3,
-                early_stopping_method="generate"
-            )
-            
-            logger.info("LangChain agent created successfully")
+            return self.embeddings.embed_query(query)
+        except Exception as e:
+            logger.warning(f"Query embedding failed, using exact-match cache only: {str(e)}")
+            return None
+    
+    async def _aembed_query(self, query: str) -> Optional[List[float]]:
+        """Async counterpart of _embed_query"""
+        if self.embeddings is None:
+            return None
+        try:
+            return await self.embeddings.aembed_query(query)
         except Exception as e:
-            logger.error(f"Error creating agent: {str(e)}")
-            raise
+            logger.warning(f"Query embedding failed, using exact-match cache only: {str(e)}")
+            return None
     
     def analyze(self, query: str) -> Dict[str, Any]:
         """Analyze data based on user query"""
         try:
-            if self.df is None:
-                return {
-                    "success": False,
-                    "error": "No data loaded",
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            
-            # For mock LLM, provide a simple response
-            if isinstance(self.llm, MockLLM):
-                return {
-                    "success": True,
-                    "response": f"Mock analysis for query: '{query}'. Data shape: {self.df.shape}. This is a mock response - add your OpenAI API key for real analysis.",
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            
-            # Create comprehensive data context automatically
-            data_context = self._create_data_context()
-            
-            # Create a comprehensive prompt that includes all the data context
-            full_prompt = f"""
-            {data_context}
-            
-            سوال کاربر: {query}
-            
-            شما یک تحلیلگر داده هوشمند هستید که باید به زبان فارسی پاسخ دهید. لطفاً تحلیل دقیق و ساختاریافته از داده‌های سنسور ارائه دهید.
-            
-            الزامات پاسخ:
-            1. حتماً به زبان فارسی پاسخ دهید
-            2. پاسخ را با بولت پوینت ساختاریافته ارائه دهید
-            3. فقط بر اساس داده‌های واقعی موجود تحلیل کنید
-            4. مقادیر دقیق و آمار را ذکر کنید
-            5. الگوها و روندها را شناسایی کنید
-            6. نتیجه‌گیری عملی ارائه دهید
-            
-            فرمت پاسخ مورد نظر:
-            پاسخ طبیعی و دوستانه ارائه دهید که شامل:
-            1. پاسخ طبیعی و گفتگویی درباره داده‌ها
-            2. بخش داده‌های ساختاریافته با فرمت:
-            ```
-            📊 داده‌های سنسور بر اساس بازه زمانی:
-            • نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین ساعت)
-            • نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین 6 ساعت)
-            • نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین 24 ساعت)
-            • نام سنسور: میانگین: X.X، حداقل: X.X، حداکثر: X.X (آخرین هفته)
-            ```
-            3. بخش تحلیل با فرمت:
-            ```
-            🔍 تحلیل:
-            • روند: [توصیف روند - افزایش، کاهش، ثابت]
-            • الگو: [شناسایی الگوهای موجود در داده‌ها]
-            • اهمیت: [این داده‌ها برای مزرعه چه معنایی دارد]
-            • سطح هشدار: [پایین/متوسط/بالا بر اساس داده‌ها]
-            ```
-            4. بخش توصیه‌ها با فرمت:
-            ```
-            💡 توصیه‌ها:
-            • اقدامات فوری: [چه کاری باید همین الان انجام داد]
-            • نظارت: [چه چیزی را باید زیر نظر داشت]
-            • بلندمدت: [توصیه‌های استراتژیک برای آینده]
-            • منابع: [ابزارها یا روش‌های قابل استفاده]
-            ```
-            
-            فقط بر اساس داده‌های موجود تحلیل کنید و مقادیر دقیق را ذکر کنید.
-            """
+            precheck = self._precheck_analysis(query)
+            if precheck is not None:
+                return precheck
+            
+            # Repeated or near-duplicate questions over the same data skip the LLM
+            messages, scope = self._analysis_snapshot(query)
+            cached = self.response_cache.get(query, scope)
+            if cached is not None:
+                return self._analysis_result(cached)
+            embedding = self._embed_query(query)
+            cached = self.response_cache.get_similar(embedding, scope) if embedding is not None else None
+            if cached is not None:
+                return self._analysis_result(cached)
             
             # Use the LLM directly with the comprehensive prompt
-            response = self.llm.invoke(full_prompt)
-            
-            # Extract the response content
-            if hasattr(response, 'content'):
-                response_text = response.content
-            else:
-                response_text = str(response)
+            result = self._analysis_result(self.llm.invoke(messages))
+            self.response_cache.put(query, scope, result["response"], embedding)
+            return result
             
+        except Exception as e:
+            logger.error(f"Error in analysis: {str(e)}")
             return {
-                "success": True,
-                "response": response_text,
+                "success": False,
+                "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
             }
+    
+    async def aanalyze(self, query: str) -> Dict[str, Any]:
+        """Analyze data based on user query without blocking the event loop"""
+        try:
+            precheck = self._precheck_analysis(query)
+            if precheck is not None:
+                return precheck
+            
+            # Snapshot before the first await: the service is shared, and another request can
+            # load different data while this one waits on the embedding or the LLM
+            messages, scope = self._analysis_snapshot(query)
+            cached = self.response_cache.get(query, scope)
+            if cached is not None:
+                return self._analysis_result(cached)
+            embedding = await self._aembed_query(query)
+            cached = self.response_cache.get_similar(embedding, scope) if embedding is not None else None
+            if cached is not None:
+                return self._analysis_result(cached)
+            
+            async with self._llm_semaphore:
+                response = await self.llm.ainvoke(messages)
+            result = self._analysis_result(response)
+            self.response_cache.put(query, scope, result["response"], embedding)
+            return result
             
         except Exception as e:
             logger.error(f"Error in analysis: {str(e)}")
@@ -414,76 +685,215 @@ class LangChainService:
                 "timestamp": datetime.utcnow().isoformat()
             }
     
+    def start_analysis_stream(self, query: str) -> Tuple[Optional[Dict[str, Any]], Optional[AsyncIterator[str]]]:
+        """Snapshot a streaming analysis of the data loaded now
+        
+        Returns (result, tokens). result is set when no LLM call is needed or the snapshot
+        fails, and tokens is then None. Otherwise tokens streams the answer for this snapshot,
+        so loads by later requests do not change it, and raises if the LLM call fails.
+        """
+        try:
+            precheck = self._precheck_analysis(query)
+            if precheck is not None:
+                return precheck, None
+            
+            messages, scope = self._analysis_snapshot(query)
+            return None, self._astream_analysis(query, messages, scope)
+            
+        except Exception as e:
+            logger.error(f"Error in streaming analysis: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.utcnow().isoformat()
+            }, None
+    
+    async def _astream_analysis(self, query: str, messages: List, scope: tuple):
+        """Stream the analysis response for a start_analysis_stream snapshot token by token"""
+        # A cached answer is sent whole; there is nothing to stream
+        cached = self.response_cache.get(query, scope)
+        embedding = None
+        if cached is None:
+            embedding = await self._aembed_query(query)
+            cached = self.response_cache.get_similar(embedding, scope) if embedding is not None else None
+        if cached is not None:
+            yield cached
+            return
+        
+        parts = []
+        async with self._llm_semaphore:
+            async for chunk in self.llm.astream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        
+        # Only complete responses are cached (a disconnect closes the generator before this)
+        self.response_cache.put(query, scope, "".join(parts), embedding)
+    
+    def _numeric_summary(self) -> Optional[pd.DataFrame]:
+        """count/min/max/mean of the numeric columns for prompts (no quantile sorts), once per load"""
+        if self._numeric_summary_cache is None and self._numeric_cols:
+            self._numeric_summary_cache = self.df[list(self._numeric_cols)].agg(['count', 'min', 'max', 'mean'])
+        return self._numeric_summary_cache
+    
+    def _describe_numeric(self) -> Optional[pd.DataFrame]:
+        """Full describe() of the numeric columns for the summary API, once per load; None without numeric columns"""
+        if self._describe is None and self._numeric_cols:
+            self._describe = self.df[list(self._numeric_cols)].describe()
+        return self._describe
+    
+    def _compute_stats(self) -> Dict[str, Dict[Any, float]]:
+        """Per-sensor count/min/max/mean/std of 'value' in a single pass over the column arrays"""
+        if self._sensor_codes is None or self._value is None:
+            return {}
+        
+        if self._stats_cache is not None:
+            return self._stats_cache
+        
+        codes, sensors, values = self._sensor_codes, self._sensor_uniq, self._value
+        valid = (codes >= 0) & ~np.isnan(values)
+        count, minimum, maximum, mean, std = _group_stats(
+            np.ascontiguousarray(codes[valid], dtype=np.int32),
+            np.ascontiguousarray(values[valid]),
+            len(sensors)
+        )
+        
+        stats = {
+            'count': dict(zip(sensors, count.tolist())),
+            'min': dict(zip(sensors, minimum.tolist())),
+            'max': dict(zip(sensors, maximum.tolist())),
+            'mean': dict(zip(sensors, mean.tolist())),
+            'std': dict(zip(sensors, std.tolist()))
+        }
+        
+        self._stats_cache = stats
+        return stats
+    
+    def _compute_window_stats(self) -> Dict[Any, Dict[str, Dict[str, float]]]:
+        """Per-sensor min/max/mean/count over the STAT_WINDOWS ending at the latest reading"""
+        if self._window_stats_cache is not None:
+            return self._window_stats_cache
+        if self._sensor_codes is None or self._value is None or 'timestamp' not in self.df.columns:
+            return {}
+        
+        ts = self.df['timestamp'].to_numpy(dtype='datetime64[ns]').view('i8')
+        valid_ts = ts[ts != np.iinfo(np.int64).min]  # NaT
+        if len(valid_ts) == 0:
+            return {}
+        
+        # Windows end at the newest reading so historical loads still fill the buckets
+        ages = (valid_ts.max() - ts) / 1e9
+        ages[ts == np.iinfo(np.int64).min] = np.inf
+        edges = np.array([seconds for _, seconds in STAT_WINDOWS], dtype=np.float64)
+        count, minimum, maximum, mean = _window_stats(ages, self._value, self._sensor_codes, len(self._sensor_uniq), edges)
+        
+        window_stats = {}
+        for i, sensor in enumerate(self._sensor_uniq):
+            window_stats[sensor] = {
+                label: {'min': minimum[i, w].item(), 'max': maximum[i, w].item(), 'mean': mean[i, w].item(), 'count': int(count[i, w])}
+                for w, (label, _) in enumerate(STAT_WINDOWS) if count[i, w]
+            }
+        
+        self._window_stats_cache = window_stats
+        return window_stats
+    
+    def _cache_scope(self, query: str) -> tuple:
+        """Response cache scope for a query: the loaded data plus what the query asks about"""
+        sensors = [] if self._sensor_uniq is None else [str(sensor).lower() for sensor in self._sensor_uniq]
+        return self._data_fingerprint(), _query_slots(query, sensors)
+    
+    def _data_fingerprint(self) -> tuple:
+        """Identify the loaded data for response caching (computed once per load)
+        
+        Built from the data itself rather than object identity, so persisted answers
+        match the same data after a restart. The content hash covers every cell, so a
+        corrected reading invalidates cached answers even when row count and time span stay put.
+        """
+        if self._fingerprint is None:
+            has_rows = 'timestamp' in self.df.columns and len(self.df) > 0
+            first_timestamp = str(self.df['timestamp'].iloc[0]) if has_rows else None
+            last_timestamp = str(self.df['timestamp'].iloc[-1]) if has_rows else None
+            content_hash = int(pd.util.hash_pandas_object(self.df, index=False).sum())
+            self._fingerprint = (len(self.df), tuple(self.df.columns), first_timestamp, last_timestamp, content_hash)
+        return self._fingerprint
+    
     def _create_data_context(self) -> str:
         """Create comprehensive data context as JSON for AI analysis"""
         try:
-            if self.df is None:
-                return "No data available for analysis."
+            if self.df is None or len(self.df) == 0:
+                return _EMPTY_CONTEXT
+            
+            # The context only changes when load_data_from_db runs, which clears this cache
+            if self._context_cache is not None:
+                return self._context_cache
             
-            # Convert DataFrame to JSON for comprehensive context
-            data_json = self.df.to_json(orient='records', date_format='iso')
+            if len(self.df) < SMALL_CONTEXT_ROWS:
+                self._context_cache = self._create_small_data_context()
+                return self._context_cache
             
             # Get comprehensive statistics
-            numeric_cols = self.df.select_dtypes(include=['number']).columns
             stats_summary = {}
-            if len(numeric_cols) > 0:
-                stats_summary = self.df[numeric_cols].describe().to_dict()
+            if self._numeric_cols:
+                stats_summary = self._numeric_summary().to_dict()
             
             # Get sensor-specific analysis
-            sensor_analysis = {}
-            if 'sensor_type' in self.df.columns and 'value' in self.df.columns:
-                sensor_analysis = self.df.groupby('sensor_type')['value'].agg([
-                    'count', 'min', 'max', 'mean', 'std'
-                ]).to_dict()
+            sensor_analysis = self._compute_stats()
+            
+            # Get per-sensor statistics over trailing time windows
+            window_analysis = self._compute_window_stats()
             
             # Get latest readings
-            latest_readings = self.df.tail(10).to_dict('records') if len(self.df) > 0 else []
+            latest_readings = _records_json(self.df.tail(10))
             
             # Create comprehensive context
-            context = f"""
-            CONTEXT تحلیل داده‌های سنسور:
-            
-            نمای کلی مجموعه داده:
-            - تعداد کل رکوردها: {len(self.df)}
-            - ستون‌ها: {list(self.df.columns)}
-            - انواع داده: {dict(self.df.dtypes)}
-            - مقادیر گمشده: {self.df.isnull().sum().to_dict()}
-            
-            خلاصه آماری:
-            {stats_summary}
-            
-            تحلیل سنسور بر اساس نوع:
-            {sensor_analysis}
-            
-            آخرین 10 قرائت (JSON):
-            {latest_readings}
-            
-            نمونه کامل مجموعه داده (20 رکورد اول):
-            {self.df.head(20).to_dict('records')}
-            
-            این داده‌ها نشان‌دهنده قرائت‌های سنسور در زمان واقعی هستند. لطفاً این مجموعه داده جامع را تحلیل کنید تا به سوالات کاربر با بینش‌های خاص، آمار و الگوها پاسخ دهید.
-            """
+            context = DATA_CONTEXT_TEMPLATE.substitute(
+                row_count=len(self.df),
+                columns=list(self.df.columns),
+                dtypes=self._dtypes_dict,
+                null_counts=self._null_counts,
+                stats_summary=stats_summary,
+                sensor_analysis=sensor_analysis,
+                window_analysis=window_analysis,
+                latest_readings=latest_readings,
+                sample_records=_records_json(self.df.head(20))
+            )
             
+            self._context_cache = context
             return context
             
         except Exception as e:
             logger.error(f"Error creating data context: {str(e)}")
             return f"Error creating data context: {str(e)}"
     
+    def _create_small_data_context(self) -> str:
+        """Context for a handful of rows: every record inline, no aggregate statistics"""
+        return SMALL_DATA_CONTEXT_TEMPLATE.substitute(
+            row_count=len(self.df),
+            columns=list(self.df.columns),
+            dtypes=self._dtypes_dict,
+            records=_records_json(self.df)
+        )
+    
     def get_data_summary(self) -> Dict[str, Any]:
         """Get summary of loaded data"""
         if self.df is None:
             return {"error": "No data loaded"}
         
         try:
-            # Convert numpy dtypes to strings for JSON serialization
-            dtypes_dict = {col: str(dtype) for col, dtype in self.df.dtypes.items()}
-            
-            # Convert numpy statistics to regular Python types
-            stats_dict = {}
-            for col, stats in self.df.describe().items():
-                stats_dict[col] = {stat: float(val) if not pd.isna(val) else None 
-                                for stat, val in stats.items()}
+            # dtypes as strings for JSON serialization, computed at load time
+            dtypes_dict = dict(self._dtypes_dict)
+            
+            # Convert numpy statistics to regular Python types (NaN -> None) in one array pass;
+            # the result is invariant until the next load
+            if self._summary_stats is None:
+                self._summary_stats = {}
+                describe = self._describe_numeric()
+                if describe is not None:
+                    values = describe.to_numpy(dtype=np.float64)
+                    stats = values.astype(object)
+                    stats[np.isnan(values)] = None
+                    self._summary_stats = {col: dict(zip(describe.index, stats[:, i])) for i, col in enumerate(describe.columns)}
+            stats_dict = {col: dict(col_stats) for col, col_stats in self._summary_stats.items()}
             
             summary = {
                 "shape": list(self.df.shape),  # Convert tuple to list
@@ -502,19 +912,16 @@ class LangChainService:
             return {"error": "No data loaded"}
         
         try:
-            if chart_type.lower() == 'line':
-                fig = px.line(self.df, x=columns[0], y=columns[1], title=f"Line Chart: {columns[0]} vs {columns[1]}")
-            elif chart_type.lower() == 'bar':
-                fig = px.bar(self.df, x=columns[0], y=columns[1], title=f"Bar Chart: {columns[0]} vs {columns[1]}")
-            elif chart_type.lower() == 'scatter':
-                fig = px.scatter(self.df, x=columns[0], y=columns[1], title=f"Scatter Plot: {columns[0]} vs {columns[1]}")
-            elif chart_type.lower() == 'histogram':
-                fig = px.histogram(self.df, x=columns[0], title=f"Histogram: {columns[0]}")
-            else:
-                return {"error": "Unsupported chart type"}
-            
-            # Convert to JSON for frontend
-            chart_json = fig.to_json()
+            # Serialized charts are reused until the next load
+            key = (chart_type.lower(), tuple(columns))
+            chart_json = self._chart_cache.get(key)
+            if chart_json is None:
+                fig = _make_figure(self.df, chart_type, columns)
+                if fig is None:
+                    return {"error": "Unsupported chart type"}
+                
+                # Convert to JSON for frontend (figure was built from validated graph objects)
+                chart_json = self._chart_cache[key] = pio.to_json(fig, validate=False)
             return {
                 "success": True,
                 "chart": chart_json,
@@ -3,259 +3,637 @@ Query Builder Module for Smart Agriculture Platform
 Converts semantic JSON into valid SQL templates using ontology mappings
 """
 
+import re
+import sys
+import time
 import logging
-from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from string import Template
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Tuple, Union
 from datetime import datetime
 import json
 
 logger = logging.getLogger(__name__)
 
+# Semantic JSON defaults, shared by every builder that reads one
+_DEFAULT_ENTITY = "temperature"
+_DEFAULT_AGGREGATION = "current"
+_DEFAULT_TIME_RANGE = "last_24_hours"
+_DEFAULT_GROUPING = "none"
+_DEFAULT_FORMAT = "value"
+
+# Semantic JSON enum values (in the order suggestions list them) and their membership sets
+_REQUIRED_FIELDS = ("entity",)
+_SUPPORTED_AGGREGATIONS = ("current", "latest", "average", "min", "max", "count")
+_SUPPORTED_GROUPINGS = ("none", "by_day", "daily", "by_hour", "hourly", "by_minute", "minutely", "by_week", "weekly")
+_VALID_AGGREGATIONS = frozenset(_SUPPORTED_AGGREGATIONS)
+_VALID_GROUPINGS = frozenset(_SUPPORTED_GROUPINGS)
+_AGGREGATION_SUGGESTION = "Use one of: " + ", ".join(_SUPPORTED_AGGREGATIONS)
+_GROUPING_SUGGESTION = "Use one of: " + ", ".join(_SUPPORTED_GROUPINGS)
+
+# Seconds comparison SQL (whose bounds are relative to now) is reused for the same semantic JSON
+COMPARISON_SQL_TTL = 60
+
+_DEFAULT_TIME_WINDOW = {"days": 1, "hours": 24, "minutes": 1440}
+
+# Time range token -> SQL time window, in the order they were historically matched as substrings
+_TIME_RANGE_NEEDLES = (
+    ("last_3_days", {"days": 3, "hours": 72, "minutes": 4320}),
+    ("three_days", {"days": 3, "hours": 72, "minutes": 4320}),
+    ("last_7_days", {"days": 7, "hours": 168, "minutes": 10080}),
+    ("one_week", {"days": 7, "hours": 168, "minutes": 10080}),
+    ("last_2_days", {"days": 2, "hours": 48, "minutes": 2880}),
+    ("two_days", {"days": 2, "hours": 48, "minutes": 2880}),
+    ("last_24_hours", _DEFAULT_TIME_WINDOW),
+    ("one_day", _DEFAULT_TIME_WINDOW),
+    ("last_4_hours", {"days": 0, "hours": 4, "minutes": 240}),
+    ("four_hours", {"days": 0, "hours": 4, "minutes": 240}),
+    ("last_6_hours", {"days": 0, "hours": 6, "minutes": 360}),
+    ("six_hours", {"days": 0, "hours": 6, "minutes": 360}),
+    ("last_8_hours", {"days": 0, "hours": 8, "minutes": 480}),
+    ("eight_hours", {"days": 0, "hours": 8, "minutes": 480}),
+    ("last_12_hours", {"days": 0, "hours": 12, "minutes": 720}),
+    ("twelve_hours", {"days": 0, "hours": 12, "minutes": 720}),
+    ("last_2_hours", {"days": 0, "hours": 2, "minutes": 120}),
+    ("two_hours", {"days": 0, "hours": 2, "minutes": 120}),
+    ("last_hour", {"days": 0, "hours": 1, "minutes": 60}),
+    ("one_hour", {"days": 0, "hours": 1, "minutes": 60}),
+    ("last_30_minutes", {"days": 0, "hours": 0, "minutes": 30}),
+    ("last_4_weeks", {"days": 28, "hours": 672, "minutes": 40320}),
+    ("four_weeks", {"days": 28, "hours": 672, "minutes": 40320}),
+    ("last_2_weeks", {"days": 14, "hours": 336, "minutes": 20160}),
+    ("two_weeks", {"days": 14, "hours": 336, "minutes": 20160}),
+    ("last_week", {"days": 7, "hours": 168, "minutes": 10080}),
+)
+
+# Exact tokens resolve with one dict lookup (first needle wins, as in the substring scan)
+_TIME_RANGE_TABLE = {}
+for _needle, _window in _TIME_RANGE_NEEDLES:
+    _TIME_RANGE_TABLE.setdefault(_needle, _window)
+
+# last_N_{unit}s for counts without a named token
+_TIME_RANGE_RE = re.compile(r"last_(\d+)_(minute|hour|day|week)s?")
+
+# Relative time range wording that turns a single-range comparison into a breakdown
+# (plural units only: "today" must not match "day")
+_TIME_KEYWORDS_RE = re.compile(r"days|hours|weeks|months|last_|past_|ago", re.IGNORECASE)
+
+# Any expanded range in one pass; the count is optional so "days_ago" without one still matches
+_AGO_RE = re.compile(r"(?:(\d+)_)?(hours|days|weeks)_ago")
+
+_MINUTES_PER_UNIT = {"minute": 1, "hour": 60, "day": 1440, "week": 10080}
+
+@lru_cache(maxsize=128)
+def _scaled_time_window(count: int, unit: str) -> Dict[str, int]:
+    """SQL time window for count units, e.g. (5, 'day') -> 5 days"""
+    minutes = count * _MINUTES_PER_UNIT[unit]
+    return {"days": minutes // 1440, "hours": minutes // 60, "minutes": minutes}
+
+@lru_cache(maxsize=256)
+def _previous_time_range(time_range: str) -> Optional[str]:
+    """Time range token to compare time_range against, e.g. 3_days_ago -> 6_days_ago"""
+    match = _AGO_RE.search(time_range)
+    if match is None:
+        return "yesterday"
+    count, unit = match.groups()
+    return f"{int(count) * 2}_{unit}_ago" if count else None
+
+# GROUP BY expression per interval, keyed by its first letter; the unit word
+# guards prefixes that share a letter ("minute" is not "month") and
+# anything unrecognised groups by hour
+_HOUR_GROUP = ("hour", "strftime('%Y-%m-%d %H:00', timestamp)")
+_TIME_GROUP = {
+    "h": _HOUR_GROUP,
+    "d": ("day", "date(timestamp)"),
+    "w": ("week", "strftime('%Y-%W', timestamp)"),
+    "m": ("month", "strftime('%Y-%m', timestamp)"),
+}
+
+def _time_group_for(granularity: str) -> str:
+    """GROUP BY expression for a time_context interval such as 'hour' or 'days'"""
+    unit, time_group = _TIME_GROUP.get(granularity[:1], _HOUR_GROUP)
+    return time_group if granularity.startswith(unit) else _HOUR_GROUP[1]
+
+def _compact_sql(sql: str) -> str:
+    """Collapse the indentation of a literal SQL layout to single spaces, interned"""
+    return sys.intern(" ".join(sql.split()))
+
+@lru_cache(maxsize=32)
+def _time_based_param_sql(granularity: str, aggregation: str) -> str:
+    """_time_based_sql with ? placeholders for sensor_type, start and end"""
+    time_group = _time_group_for(granularity)
+
+    return _compact_sql(f"""
+    SELECT {time_group} AS time_period,
+           sensor_type,
+           {aggregation}(value) AS avg_value,
+           MIN(value) AS min_value,
+           MAX(value) AS max_value,
+           COUNT(*) AS data_points
+    FROM sensor_data
+    WHERE sensor_type = ?
+      AND timestamp BETWEEN ? AND ?
+    GROUP BY {time_group}, sensor_type
+    ORDER BY time_period;
+    """)
+
+@lru_cache(maxsize=32)
+def _time_series_list_param_sql(granularity: str, count: int) -> str:
+    """Several-sensor time series with ? placeholders for count sensor types, start and end"""
+    time_group = _time_group_for(granularity)
+    placeholders = ", ".join("?" * count)
+
+    return _compact_sql(f"""
+    SELECT {time_group} AS time_period,
+           sensor_type,
+           AVG(value) AS avg_value,
+           MIN(value) AS min_value,
+           MAX(value) AS max_value,
+           COUNT(*) AS data_points
+    FROM sensor_data
+    WHERE sensor_type IN ({placeholders})
+      AND timestamp BETWEEN ? AND ?
+    GROUP BY {time_group}, sensor_type
+    ORDER BY time_period ASC, sensor_type ASC;
+    """)
+
+@lru_cache(maxsize=512)
+def _time_based_sql(sensor_type: str, start: str, end: str, granularity: str, aggregation: str) -> str:
+    """SQL for one sensor over an explicit [start, end] window grouped by granularity"""
+    # Inline the three values into the compacted parameterized layout
+    head, after_sensor, after_start, tail = _time_based_param_sql(granularity, aggregation).split("?")
+    return f"{head}'{sensor_type}'{after_sensor}'{start}'{after_start}'{end}'{tail}"
+
+# Compound time-aware pieces per grouping: (select, group by, condition % window value, time_window key)
+_DAY_GROUP_PARTS = ("DATE(timestamp) as time_period", "DATE(timestamp)", "timestamp >= datetime('now', '-%s days')", "days")
+_HOUR_GROUP_PARTS = (
+    "strftime('%Y-%m-%d %H:00', timestamp) as time_period", "strftime('%Y-%m-%d %H:00', timestamp)",
+    "timestamp >= datetime('now', '-%s hours')", "hours",
+)
+_MINUTE_GROUP_PARTS = (
+    "strftime('%Y-%m-%d %H:%M', timestamp) as time_period", "strftime('%Y-%m-%d %H:%M', timestamp)",
+    "timestamp >= datetime('now', '-%s minutes')", "minutes",
+)
+_WEEK_GROUP_PARTS = (
+    "strftime('%Y-%W', timestamp) as time_period", "strftime('%Y-%W', timestamp)",
+    "timestamp >= datetime('now', '-%s days')", "days",
+)
+_GROUP_PARTS = {
+    "by_day": _DAY_GROUP_PARTS, "daily": _DAY_GROUP_PARTS,
+    "by_hour": _HOUR_GROUP_PARTS, "hourly": _HOUR_GROUP_PARTS,
+    "by_minute": _MINUTE_GROUP_PARTS, "minutely": _MINUTE_GROUP_PARTS,
+    "by_week": _WEEK_GROUP_PARTS, "weekly": _WEEK_GROUP_PARTS,
+}
+
+# Breakdown buckets in match order: ((English, Persian) unit word, select, group by)
+_MONTH_GROUP_EXPR = "strftime('%Y-%m', timestamp)"
+_BREAKDOWN_GROUPING = (
+    (("hour", "ساعت"), _HOUR_GROUP_PARTS[0], _HOUR_GROUP_PARTS[1]),
+    (("week", "هفته"), _WEEK_GROUP_PARTS[0], _WEEK_GROUP_PARTS[1]),
+    (("month", "ماه"), _MONTH_GROUP_EXPR + " as time_period", _MONTH_GROUP_EXPR),
+)
+
+@lru_cache(maxsize=256)
+def _quote_in(entities: tuple) -> str:
+    """Quoted body of a sensor_type IN (...) list, e.g. ('a', 'b') -> 'a', 'b'"""
+    return "'" + "', '".join(entities) + "'"
+
+def _fallback_sql_for(entity: str) -> str:
+    """Latest readings of one sensor, the SQL every builder falls back to"""
+    entity = entity.replace("'", "''")  # entity may be unvalidated here
+    return f"SELECT * FROM sensor_data WHERE sensor_type = '{entity}' ORDER BY timestamp DESC LIMIT 5"
+
+# Single-sensor lookups with the sensor bound as a parameter
+_FALLBACK_PARAM_SQL = sys.intern("SELECT * FROM sensor_data WHERE sensor_type = ? ORDER BY timestamp DESC LIMIT 5")
+_CURRENT_VALUE_PARAM_SQL = sys.intern("SELECT * FROM sensor_data WHERE sensor_type = ? ORDER BY timestamp DESC LIMIT 1")
+_AVERAGE_VALUE_PARAM_SQL = sys.intern(
+    "SELECT AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value, COUNT(*) as data_points "
+    "FROM sensor_data WHERE sensor_type = ?"
+)
+
+# Literal pieces of one labelled per-sensor aggregate in a comparison UNION:
+# label, sensor, sensor, condition and the optional GROUP BY go between them
+_RANGE_AGGREGATE_PARTS = (
+    "SELECT '",
+    "' as time_period, '",
+    "' as sensor_type, AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value, "
+    "COUNT(*) as data_points FROM sensor_data WHERE sensor_type = '",
+    "' AND ",
+    " GROUP BY ",
+)
+
+@lru_cache(maxsize=1024)
+def _range_aggregate_sql(label: str, entity: str, condition: str, group_by: Optional[str] = None) -> str:
+    """SELECT of one sensor's aggregates over a labelled time range (equal inputs share one string)"""
+    select, period, sensor, where, group = _RANGE_AGGREGATE_PARTS
+    if group_by is None:
+        return "".join((select, label, period, entity, sensor, entity, where, condition))
+    return "".join((select, label, period, entity, sensor, entity, where, condition, group, group_by))
+
+# Extra GROUP BY within each compared time range, per grouping
+_RANGE_SUBGROUP = {
+    "by_week": "strftime('%Y-%W', timestamp)",
+    "by_month": "strftime('%Y-%m', timestamp)",
+    "by_day": "DATE(timestamp)",
+}
+
+def _disjoint_ranges(filters: List[tuple]) -> bool:
+    """True when no two (label, start, end, condition) time filters overlap"""
+    spans = sorted((start, end) for _, start, end, _ in filters)
+    if any(start >= end for start, end in spans):
+        return False
+    return all(start >= prev_end for (_, prev_end), (start, _) in zip(spans, spans[1:]))
+
+def _bucketed_ranges_sql(filters: List[tuple], entities: List[str], group_by: str) -> str:
+    """One-scan aggregate of the sensors over disjoint time filters, labelled per range by CASE"""
+    buckets = " ".join(f"WHEN {condition} THEN '{label}'" for label, _, _, condition in filters)
+    lower = min(start for _, start, _, _ in filters)
+    upper = max(end for _, _, end, _ in filters)
+    subgroup = "" if group_by == "1" else ", " + group_by
+    return (
+        f"SELECT CASE {buckets} END as time_period, sensor_type, "
+        "AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value, COUNT(*) as data_points "
+        f"FROM sensor_data WHERE sensor_type IN ({_quote_in(tuple(entities))}) "
+        f"AND timestamp >= '{lower}' AND timestamp < '{upper}' "
+        f"GROUP BY time_period, sensor_type{subgroup} HAVING time_period IS NOT NULL"
+    )
+
+# Comparison fallback when no time ranges were given: one scan over both periods of
+# the granularity, bucketed by CASE (unknown granularities use "day"). Each value is
+# (bucket expression, window condition), pre-split around the sensor name below.
+_FALLBACK_COMPARISON_BUCKETS = {
+    "hour": (
+        "CASE WHEN timestamp >= datetime('now', '-1 hour') THEN 'last_hour' ELSE 'previous_hour' END",
+        "timestamp >= datetime('now', '-2 hour')",
+    ),
+    "day": (
+        "CASE WHEN timestamp >= datetime('now', 'start of day') THEN 'today' ELSE 'yesterday' END",
+        "timestamp >= datetime('now', 'start of day', '-1 day') AND timestamp < datetime('now', 'start of day', '+1 day')",
+    ),
+    # Weeks start on Monday: '-6 days', 'weekday 1' is the Monday on or before today
+    "week": (
+        "CASE WHEN timestamp >= datetime('now', 'start of day', '-6 days', 'weekday 1') THEN 'this_week' ELSE 'last_week' END",
+        "timestamp >= datetime('now', 'start of day', '-13 days', 'weekday 1') "
+        "AND timestamp < datetime('now', 'start of day', '+1 day', 'weekday 1')",
+    ),
+}
+_FALLBACK_COMPARISON_PARTS = {
+    granularity: (
+        "SELECT " + bucket + " as time_period, '",
+        _RANGE_AGGREGATE_PARTS[2],
+        _RANGE_AGGREGATE_PARTS[3] + window + " GROUP BY 1",
+    )
+    for granularity, (bucket, window) in _FALLBACK_COMPARISON_BUCKETS.items()
+}
+
+# Marks frozen dicts in _freeze keys so they can't collide with frozen lists
+_DICT_MARK = object()
+
+def _freeze(value: Any) -> Any:
+    """Hashable, order-insensitive form of a semantic JSON value"""
+    if isinstance(value, dict):
+        return (_DICT_MARK, tuple(sorted((key, _freeze(item)) for key, item in value.items())))
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _thaw(value: Any) -> Any:
+    """Inverse of _freeze"""
+    if isinstance(value, tuple):
+        if value and value[0] is _DICT_MARK:
+            return {key: _thaw(item) for key, item in value[1]}
+        return [_thaw(item) for item in value]
+    return value
+
+def _build_sql_templates() -> Dict[str, Template]:
+    """Build SQL templates for different query patterns (parsed once, rendered with substitute)"""
+    templates = {
+        "current_value": """
+            SELECT * FROM sensor_data 
+            WHERE sensor_type = '$entity' 
+            ORDER BY timestamp DESC 
+            LIMIT 1
+        """,
+
+        "average_value": """
+            SELECT AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value, COUNT(*) as data_points
+            FROM sensor_data 
+            WHERE sensor_type = '$entity'
+        """,
+
+        "time_aware_day": """
+            SELECT DATE(timestamp) as time_period, 
+                   AVG(value) as avg_value, 
+                   MIN(value) as min_value, 
+                   MAX(value) as max_value, 
+                   COUNT(*) as data_points
+            FROM sensor_data 
+            WHERE sensor_type = '$entity' 
+            AND timestamp >= datetime('now', '-$time_range days')
+            GROUP BY DATE(timestamp)
+            ORDER BY time_period ASC
+        """,
+
+        "time_aware_hour": """
+            SELECT strftime('%Y-%m-%d %H:00', timestamp) as time_period, 
+                   AVG(value) as avg_value, 
+                   MIN(value) as min_value, 
+                   MAX(value) as max_value, 
+                   COUNT(*) as data_points
+            FROM sensor_data 
+            WHERE sensor_type = '$entity' 
+            AND timestamp >= datetime('now', '-$time_range hours')
+            GROUP BY strftime('%Y-%m-%d %H:00', timestamp)
+            ORDER BY time_period ASC
+        """,
+
+        "time_aware_minute": """
+            SELECT strftime('%Y-%m-%d %H:%M', timestamp) as time_period, 
+                   AVG(value) as avg_value, 
+                   MIN(value) as min_value, 
+                   MAX(value) as max_value, 
+                   COUNT(*) as data_points
+            FROM sensor_data 
+            WHERE sensor_type = '$entity' 
+            AND timestamp >= datetime('now', '-$time_range minutes')
+            GROUP BY strftime('%Y-%m-%d %H:%M', timestamp)
+            ORDER BY time_period ASC
+        """,
+
+        "time_aware_week": """
+            SELECT strftime('%Y-%W', timestamp) as time_period, 
+                   AVG(value) as avg_value, 
+                   MIN(value) as min_value, 
+                   MAX(value) as max_value, 
+                   COUNT(*) as data_points
+            FROM sensor_data 
+            WHERE sensor_type = '$entity' 
+            AND timestamp >= datetime('now', '-$time_range days')
+            GROUP BY strftime('%Y-%W', timestamp)
+            ORDER BY time_period ASC
+        """,
+
+        "compound_current": """
+            SELECT * FROM sensor_data 
+            WHERE sensor_type IN ($entities) 
+            ORDER BY timestamp DESC 
+            LIMIT $limit
+        """,
+
+        "compound_time_aware": """
+            SELECT $time_period_select, sensor_type, 
+                   AVG(value) as avg_value, 
+                   MIN(value) as min_value, 
+                   MAX(value) as max_value, 
+                   COUNT(*) as data_points
+            FROM sensor_data 
+            WHERE sensor_type IN ($entities) 
+            AND $time_condition
+            GROUP BY $time_period_group, sensor_type
+            ORDER BY time_period ASC, sensor_type ASC
+        """,
+
+        "trend_analysis": """
+            SELECT timestamp, value 
+            FROM sensor_data 
+            WHERE sensor_type = '$entity' 
+            ORDER BY timestamp DESC 
+            LIMIT 10
+        """,
+
+        "comparison": """
+            SELECT sensor_type, AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value
+            FROM sensor_data 
+            WHERE sensor_type IN ($entities) 
+            GROUP BY sensor_type
+        """
+    }
+    return {key: Template(_compact_sql(sql)) for key, sql in templates.items()}
+
+# Built once at import and shared read-only by every QueryBuilder
+_SQL_TEMPLATES = MappingProxyType(_build_sql_templates())
+
+# The hottest single-entity templates render as prefix + entity + suffix
+_CURRENT_VALUE_PARTS = tuple(_SQL_TEMPLATES["current_value"].template.split("$entity"))
+_AVERAGE_VALUE_PARTS = tuple(_SQL_TEMPLATES["average_value"].template.split("$entity"))
+
+@lru_cache(maxsize=1)
+def _get_shared_semantic_service() -> Any:
+    """Process-wide UnifiedSemanticQueryService for builders created without one"""
+    # Imported here: unified_semantic_service imports this module
+    from app.services.unified_semantic_service import UnifiedSemanticQueryService
+    return UnifiedSemanticQueryService()
+
 class QueryBuilder:
     """Converts semantic JSON into SQL templates using flexible templates"""
     
-    def __init__(self, ontology: Dict[str, Any]):
+    # current_granularity is optional: callers may set it to steer the comparison fallback
+    __slots__ = (
+        "ontology", "sql_templates", "_semantic_service", "_cached_sql", "_cached_comparison_sql",
+        "_shape_builders", "_valid_entities", "_fallback_sql", "current_granularity",
+    )
+    
+    def __init__(self, ontology: Dict[str, Any], semantic_service: Optional[Any] = None) -> None:
         self.ontology = ontology
-        self.sql_templates = self._build_sql_templates()
-        
-    def _build_sql_templates(self) -> Dict[str, str]:
-        """Build SQL templates for different query patterns"""
-        return {
-            "current_value": """
-                SELECT * FROM sensor_data 
-                WHERE sensor_type = '{entity}' 
-                ORDER BY timestamp DESC 
-                LIMIT 1
-            """,
-            
-            "average_value": """
-                SELECT AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value, COUNT(*) as data_points
-                FROM sensor_data 
-                WHERE sensor_type = '{entity}'
-            """,
-            
-            "time_aware_day": """
-                SELECT DATE(timestamp) as time_period, 
-                       AVG(value) as avg_value, 
-                       MIN(value) as min_value, 
-                       MAX(value) as max_value, 
-                       COUNT(*) as data_points
-                FROM sensor_data 
-                WHERE sensor_type = '{entity}' 
-                AND timestamp >= datetime('now', '-{time_range} days')
-                GROUP BY DATE(timestamp)
-                ORDER BY DATE(timestamp) ASC
-            """,
-            
-            "time_aware_hour": """
-                SELECT strftime('%Y-%m-%d %H:00', timestamp) as time_period, 
-                       AVG(value) as avg_value, 
-                       MIN(value) as min_value, 
-                       MAX(value) as max_value, 
-                       COUNT(*) as data_points
-                FROM sensor_data 
-                WHERE sensor_type = '{entity}' 
-                AND timestamp >= datetime('now', '-{time_range} hours')
-                GROUP BY strftime('%Y-%m-%d %H:00', timestamp)
-                ORDER BY strftime('%Y-%m-%d %H:00', timestamp) ASC
-            """,
-            
-            "time_aware_minute": """
-                SELECT strftime('%Y-%m-%d %H:%M', timestamp) as time_period, 
-                       AVG(value) as avg_value, 
-                       MIN(value) as min_value, 
-                       MAX(value) as max_value, 
-                       COUNT(*) as data_points
-                FROM sensor_data 
-                WHERE sensor_type = '{entity}' 
-                AND timestamp >= datetime('now', '-{time_range} minutes')
-                GROUP BY strftime('%Y-%m-%d %H:%M', timestamp)
-                ORDER BY strftime('%Y-%m-%d %H:%M', timestamp) ASC
-            """,
-            
-            "time_aware_week": """
-                SELECT strftime('%Y-%W', timestamp) as time_period, 
-                       AVG(value) as avg_value, 
-                       MIN(value) as min_value, 
-                       MAX(value) as max_value, 
-                       COUNT(*) as data_points
-                FROM sensor_data 
-                WHERE sensor_type = '{entity}' 
-                AND timestamp >= datetime('now', '-{time_range} days')
-                GROUP BY strftime('%Y-%W', timestamp)
-                ORDER BY strftime('%Y-%W', timestamp) ASC
-            """,
-            
-            "compound_current": """
-                SELECT * FROM sensor_data 
-                WHERE sensor_type IN ({entities}) 
-                ORDER BY timestamp DESC 
-                LIMIT {limit}
-            """,
-            
-            "compound_time_aware": """
-                SELECT {time_period_select}, sensor_type, 
-                       AVG(value) as avg_value, 
-                       MIN(value) as min_value, 
-                       MAX(value) as max_value, 
-                       COUNT(*) as data_points
-                FROM sensor_data 
-                WHERE sensor_type IN ({entities}) 
-                AND {time_condition}
-                GROUP BY {time_period_group}, sensor_type
-                ORDER BY {time_period_group} ASC, sensor_type ASC
-            """,
-            
-            "trend_analysis": """
-                SELECT timestamp, value 
-                FROM sensor_data 
-                WHERE sensor_type = '{entity}' 
-                ORDER BY timestamp DESC 
-                LIMIT 10
-            """,
-            
-            "comparison": """
-                SELECT sensor_type, AVG(value) as avg_value, MIN(value) as min_value, MAX(value) as max_value
-                FROM sensor_data 
-                WHERE sensor_type IN ({entities}) 
-                GROUP BY sensor_type
-            """
+        # Sensor types allowed into SQL; an ontology without sensor_mappings allows any
+        self._valid_entities = frozenset(ontology.get("sensor_mappings", {}))
+        # Fallback SQL per ontology sensor, so error paths are a lookup
+        self._fallback_sql = {entity: _fallback_sql_for(entity) for entity in self._valid_entities}
+        # Provides _time_range_to_sql_filter; the owning UnifiedSemanticQueryService passes itself
+        self._semantic_service = semantic_service
+        self.sql_templates = _SQL_TEMPLATES
+        # LRU of SQL by frozen semantic JSON (see build_sql_from_semantic_json)
+        self._cached_sql = lru_cache(maxsize=512)(self._build_sql_from_frozen)
+        self._cached_comparison_sql = lru_cache(maxsize=128)(self._build_comparison_sql_from_frozen)
+        # Builder per non-comparison shape: (entity is a list, has time_context)
+        self._shape_builders = {
+            (True, True): self._build_time_series_list_sql,
+            (False, True): self._build_time_context_sql,
+            (True, False): self._build_compound_sql,
+            (False, False): self._build_static_single_entity_sql,
         }
+        
+    def _is_valid_entity(self, entity: Union[str, List[str]]) -> bool:
+        """Whether entity (or every sensor in an entity list) is a sensor type from the ontology"""
+        valid = self._valid_entities
+        if not valid:
+            return True
+        if isinstance(entity, str):
+            return entity in valid
+        return isinstance(entity, list) and all(isinstance(e, str) and e in valid for e in entity)
+    
+    def _get_semantic_service(self) -> Any:
+        """Return the semantic service used for time filters, creating the shared one on first use"""
+        if self._semantic_service is None:
+            self._semantic_service = _get_shared_semantic_service()
+        return self._semantic_service
     
-    def build_time_based_query(self, sensor_type, time_context, aggregation="AVG"):
+    def build_time_based_query(self, sensor_type: str, time_context: Dict[str, Any], aggregation: str = "AVG") -> str:
         """Build time-based query using dynamic time_context"""
+        return _time_based_sql(
+            sensor_type, time_context["start_time"], time_context["end_time"], time_context["interval"], aggregation
+        )
+
+    def build_sql_from_semantic_json(self, semantic_json: Dict[str, Any]) -> str:
+        """Convert semantic JSON to SQL query, reusing SQL built for an identical semantic JSON"""
+        try:
+            if not semantic_json.get("comparison"):
+                return self._cached_sql(_freeze(semantic_json))
+            # Comparison SQL embeds time filters computed from the current time, so it is
+            # only reused within one COMPARISON_SQL_TTL window
+            window = int(time.time() // COMPARISON_SQL_TTL)
+            granularity = getattr(self, "current_granularity", None)
+            return self._cached_comparison_sql(_freeze(semantic_json), window, granularity)
+        except TypeError:
+            pass  # unhashable values; build directly
+        return self._build_sql_from_semantic_json(semantic_json)
+    
+    def build_parameterized_sql(self, semantic_json: Dict[str, Any]) -> Tuple[str, tuple]:
+        """Convert semantic JSON to (SQL with ? placeholders, parameters)
+        
+        Single-sensor shapes (including single-range breakdowns) and several-sensor time series
+        bind the sensors so SQLite can reuse their prepared statements; other shapes come back
+        as inline SQL with no parameters.
+        """
+        get = semantic_json.get
+        entity = get("entity", _DEFAULT_ENTITY)
+        if not self._is_valid_entity(entity):
+            logger.warning("⚠️ Unsupported entity %r, using fallback SQL", entity)
+            return _FALLBACK_PARAM_SQL, (entity if isinstance(entity, str) else "temperature",)
+        if isinstance(entity, list) and entity and not get("comparison"):
+            time_context = get("time_context")
+            try:
+                if time_context:
+                    sql = _time_series_list_param_sql(time_context["interval"], len(entity))
+                    return sql, (*entity, time_context["start_time"], time_context["end_time"])
+            except (KeyError, TypeError, AttributeError):
+                pass  # malformed time_context; the inline builder falls back
+        elif isinstance(entity, str) and not get("comparison"):
+            time_context = get("time_context")
+            try:
+                if time_context:
+                    sql = _time_based_param_sql(time_context["interval"], "AVG")
+                    return sql, (entity, time_context["start_time"], time_context["end_time"])
+            except (KeyError, TypeError, AttributeError):
+                pass  # malformed time_context; the inline builder falls back
+            else:
+                aggregation = get("aggregation", _DEFAULT_AGGREGATION)
+                if aggregation in ("current", "latest"):
+                    return _CURRENT_VALUE_PARAM_SQL, (entity,)
+                if aggregation == "average" and get("grouping", _DEFAULT_GROUPING) == "none":
+                    return _AVERAGE_VALUE_PARAM_SQL, (entity,)
+        elif isinstance(entity, str) and not get("time_context"):
+            # Single-range comparison over relative wording is a breakdown of that range
+            time_range = get("time_range", _DEFAULT_TIME_RANGE)
+            if isinstance(time_range, str) and _TIME_KEYWORDS_RE.search(time_range):
+                return self._build_daily_breakdown_query(entity, time_range)
+        return self.build_sql_from_semantic_json(semantic_json), ()
+    
+    def _build_sql_from_frozen(self, frozen_json: tuple) -> str:
+        return self._build_sql_from_semantic_json(_thaw(frozen_json))
+    
+    def _build_comparison_sql_from_frozen(self, frozen_json: tuple, window: int, granularity: Optional[str]) -> str:
+        # window and granularity only key the cache
+        return self._build_sql_from_semantic_json(_thaw(frozen_json))
+    
+    def _build_sql_from_semantic_json(self, semantic_json: Dict[str, Any]) -> str:
+        """Convert semantic JSON to SQL query"""
+        try:
+            logger.info("🔧 Building SQL from semantic JSON: %s", semantic_json)
+            
+            get = semantic_json.get
+            entity = get("entity", _DEFAULT_ENTITY)
+            time_context = get("time_context")
+            
+            # Sensor types are interpolated into the SQL text, so only ontology sensors get through
+            if not self._is_valid_entity(entity):
+                logger.warning("⚠️ Unsupported entity %r, using fallback SQL", entity)
+                return self._get_fallback_sql(entity if isinstance(entity, str) else "temperature")
+            
+            # Non-comparison shapes (and anything with a time_context) go straight to their builder
+            if time_context or not get("comparison", False):
+                if time_context:
+                    logger.info("🔧 Using dynamic time_context: %s", time_context)
+                build = self._shape_builders[isinstance(entity, list), bool(time_context)]
+                return build(entity, semantic_json)
+            
+            # Extract semantic components for comparison queries
+            aggregation = get("aggregation", _DEFAULT_AGGREGATION)
+            time_range = get("time_range", _DEFAULT_TIME_RANGE)
+            grouping = get("grouping", _DEFAULT_GROUPING)
+            
+            # Check if this is time range comparison (multiple time periods) - PRIORITY
+            if isinstance(time_range, list) and len(time_range) > 1:
+                return self._build_time_comparison_sql(entity, time_range, aggregation, grouping)
+            # Check if this is entity comparison (multiple sensors)
+            elif isinstance(entity, list) and len(entity) > 1:
+                return self._build_entity_comparison_sql(entity, aggregation, time_range)
+            # Single entity + single time range but comparison requested: static time range logic
+            elif isinstance(time_range, str) and _TIME_KEYWORDS_RE.search(time_range):
+                return self._build_daily_breakdown_sql(entity, time_range, aggregation, grouping)
+            else:
+                if isinstance(time_range, list):
+                    comparison_ranges = time_range
+                else:
+                    comparison_ranges = [time_range, self._get_previous_time_range(time_range)]
+                return self._build_time_comparison_sql(entity, comparison_ranges, aggregation, grouping)
+            
+        except Exception as e:
+            logger.error("❌ Error building SQL from semantic JSON: %s", e)
+            return self._get_fallback_sql(entity if isinstance(entity, str) else "temperature")
+    
+    def _build_time_series_list_sql(self, entities: List[str], semantic_json: Dict[str, Any]) -> str:
+        """Build time-series SQL for several sensors over the semantic JSON's time_context"""
+        time_context = semantic_json["time_context"]
+        sensor_types = _quote_in(tuple(entities))
         start = time_context["start_time"]
         end = time_context["end_time"]
         granularity = time_context["interval"]
-
-        if granularity.startswith("hour"):
-            time_group = "strftime('%Y-%m-%d %H:00', timestamp)"
-        elif granularity.startswith("day"):
-            time_group = "date(timestamp)"
-        elif granularity.startswith("week"):
-            time_group = "strftime('%Y-%W', timestamp)"
-        elif granularity.startswith("month"):
-            time_group = "strftime('%Y-%m', timestamp)"
-        else:
-            time_group = "strftime('%Y-%m-%d %H:00', timestamp)"
-
+        
+        time_group = _time_group_for(granularity)
+        
         return f"""
         SELECT {time_group} AS time_period,
                sensor_type,
-               {aggregation}(value) AS avg_value,
+               AVG(value) AS avg_value,
                MIN(value) AS min_value,
                MAX(value) AS max_value,
                COUNT(*) AS data_points
         FROM sensor_data
-        WHERE sensor_type = '{sensor_type}'
+        WHERE sensor_type IN ({sensor_types})
           AND timestamp BETWEEN '{start}' AND '{end}'
         GROUP BY {time_group}, sensor_type
-        ORDER BY time_period;
+        ORDER BY time_period ASC, sensor_type ASC;
         """
-
-    def build_sql_from_semantic_json(self, semantic_json: Dict[str, Any]) -> str:
-        """Convert semantic JSON to SQL query"""
-        try:
-            logger.info(f"🔧 Building SQL from semantic JSON: {semantic_json}")
-            
-            # Extract semantic components
-            entity = semantic_json.get("entity", "temperature")
-            aggregation = semantic_json.get("aggregation", "current")
-            time_range = semantic_json.get("time_range", "last_24_hours")
-            grouping = semantic_json.get("grouping", "none")
-            format_type = semantic_json.get("format", "value")
-            comparison = semantic_json.get("comparison", False)
-            
-            # Check if time_context is available for dynamic query generation
-            time_context = semantic_json.get("time_context")
-            if time_context:
-                logger.info(f"🔧 Using dynamic time_context: {time_context}")
-                # Use dynamic time-based query generation
-                if isinstance(entity, list):
-                    # Handle multiple entities
-                    sensor_types = "', '".join(entity)
-                    start = time_context["start_time"]
-                    end = time_context["end_time"]
-                    granularity = time_context["interval"]
-                    
-                    if granularity.startswith("hour"):
-                        time_group = "strftime('%Y-%m-%d %H:00', timestamp)"
-                    elif granularity.startswith("day"):
-                        time_group = "date(timestamp)"
-                    elif granularity.startswith("week"):
-                        time_group = "strftime('%Y-%W', timestamp)"
-                    elif granularity.startswith("month"):
-                        time_group = "strftime('%Y-%m', timestamp)"
-                    else:
-                        time_group = "strftime('%Y-%m-%d %H:00', timestamp)"
-                    
-                    return f"""
-                    SELECT {time_group} AS time_period,
-                           sensor_type,
-                           AVG(value) AS avg_value,
-                           MIN(value) AS min_value,
-                           MAX(value) AS max_value,
-                           COUNT(*) AS data_points
-                    FROM sensor_data
-                    WHERE sensor_type IN ('{sensor_types}')
-                      AND timestamp BETWEEN '{start}' AND '{end}'
-                    GROUP BY {time_group}, sensor_type
-                    ORDER BY time_period ASC, sensor_type ASC;
-                    """
-                else:
-                    # Single entity with dynamic time context
-                    return self.build_time_based_query(entity, time_context, "AVG")
-            
-            # Handle comparison queries
-            if comparison:
-                # Check if this is time range comparison (multiple time periods) - PRIORITY
-                if isinstance(time_range, list) and len(time_range) > 1:
-                    return self._build_time_comparison_sql(entity, time_range, aggregation, grouping)
-                # Check if this is entity comparison (multiple sensors)
-                elif isinstance(entity, list) and len(entity) > 1:
-                    return self._build_entity_comparison_sql(entity, aggregation, time_range)
-                else:
-                    # Single entity + single time range but comparison requested
-                    # Use dynamic time_context if available, otherwise fallback to static logic
-                    if time_context:
-                        return self.build_time_based_query(entity, time_context, "AVG")
-                    else:
-                        # Fallback to static time range logic
-                        if isinstance(time_range, str) and any(keyword in time_range.lower() for keyword in ["days", "hours", "weeks", "months", "last_", "past_", "ago"]):
-                            return self._build_daily_breakdown_sql(entity, time_range, aggregation, grouping)
-                        else:
-                            if isinstance(time_range, list):
-                                comparison_ranges = time_range
-                            else:
-                                comparison_ranges = [time_range, self._get_previous_time_range(time_range)]
-                            return self._build_time_comparison_sql(entity, comparison_ranges, aggregation, grouping)
-            
-            # Handle compound entities (multiple sensors)
-            if isinstance(entity, list):
-                return self._build_compound_sql(entity, semantic_json)
-            
-            # Handle single entity queries - use dynamic time_context if available
-            if time_context:
-                return self.build_time_based_query(entity, time_context, "AVG")
-            else:
-                # Fallback to static logic
-                return self._build_single_entity_sql(entity, aggregation, time_range, grouping, format_type)
-            
-        except Exception as e:
-            logger.error(f"❌ Error building SQL from semantic JSON: {e}")
-            return self._get_fallback_sql(entity if isinstance(entity, str) else "temperature")
     
-    def _build_single_entity_sql(self, entity: str, aggregation: str, time_range: str, grouping: str, format_type: str) -> str:
+    def _build_time_context_sql(self, entity: str, semantic_json: Dict[str, Any]) -> str:
+        """Build time-series SQL for one sensor over the semantic JSON's time_context"""
+        return self.build_time_based_query(entity, semantic_json["time_context"], "AVG")
+    
+    def _build_static_single_entity_sql(self, entity: str, semantic_json: Dict[str, Any]) -> str:
+        """Build SQL for one sensor from the semantic JSON's static time_range"""
+        get = semantic_json.get
+        return self._build_single_entity_sql(
+            entity,
+            get("aggregation", _DEFAULT_AGGREGATION),
+            get("time_range", _DEFAULT_TIME_RANGE),
+            get("grouping", _DEFAULT_GROUPING),
+            get("format", _DEFAULT_FORMAT),
+        )
+    
+    def _build_single_entity_sql(self, entity: str, aggregation: str, time_range: Union[str, List[str]], grouping: str, format_type: str) -> str:
         """Build SQL for single entity queries - now uses dynamic time_context"""
         try:
             # For current/latest values, use simple template
             if aggregation == "current" or aggregation == "latest":
-                template = self.sql_templates["current_value"]
-                return template.format(entity=entity)
+                prefix, suffix = _CURRENT_VALUE_PARTS
+                return prefix + entity + suffix
             
             # For average values without grouping, use simple template
             elif aggregation == "average" and grouping == "none":
-                template = self.sql_templates["average_value"]
-                return template.format(entity=entity)
+                prefix, suffix = _AVERAGE_VALUE_PARTS
+                return prefix + entity + suffix
             
             # For grouped queries, use dynamic time_context approach
             # This method is now primarily a fallback when time_context is not available
@@ -266,56 +644,57 @@ class QueryBuilder:
                 
                 if aggregation == "average" and grouping in ["by_day", "daily"]:
                     template = self.sql_templates["time_aware_day"]
-                    return template.format(entity=entity, time_range=time_window["days"])
+                    return template.substitute(entity=entity, time_range=time_window["days"])
                 
                 elif aggregation == "average" and grouping in ["by_hour", "hourly"]:
                     template = self.sql_templates["time_aware_hour"]
-                    return template.format(entity=entity, time_range=time_window["hours"])
+                    return template.substitute(entity=entity, time_range=time_window["hours"])
                 
                 elif aggregation == "average" and grouping in ["by_minute", "minutely"]:
                     template = self.sql_templates["time_aware_minute"]
-                    return template.format(entity=entity, time_range=time_window["minutes"])
+                    return template.substitute(entity=entity, time_range=time_window["minutes"])
             
                 elif aggregation == "average" and grouping in ["by_week", "weekly"]:
                     template = self.sql_templates["time_aware_week"]
-                    return template.format(entity=entity, time_range=time_window["days"])
+                    return template.substitute(entity=entity, time_range=time_window["days"])
             
                 elif format_type == "trend":
                     template = self.sql_templates["trend_analysis"]
-                    return template.format(entity=entity)
+                    return template.substitute(entity=entity)
             
                 else:
                 # Default fallback
                      return self._get_fallback_sql(entity)
                 
         except Exception as e:
-            logger.error(f"❌ Error building single entity SQL: {e}")
+            logger.error("❌ Error building single entity SQL: %s", e)
             return self._get_fallback_sql(entity)
     
     def _build_compound_sql(self, entities: List[str], semantic_json: Dict[str, Any]) -> str:
         """Build SQL for compound queries (multiple sensors)"""
         try:
-            aggregation = semantic_json.get("aggregation", "current")
-            time_range = semantic_json.get("time_range", "last_24_hours")
-            grouping = semantic_json.get("grouping", "none")
+            get = semantic_json.get
+            aggregation = get("aggregation", _DEFAULT_AGGREGATION)
+            time_range = get("time_range", _DEFAULT_TIME_RANGE)
+            grouping = get("grouping", _DEFAULT_GROUPING)
             
             # Create entities list for SQL IN clause
-            entities_str = "', '".join(entities)
+            entities_str = _quote_in(tuple(entities))
             
             # Map time range to SQL time window
             time_window = self._parse_time_range(time_range)
             
             if aggregation == "current" or aggregation == "latest":
                 template = self.sql_templates["compound_current"]
-                return template.format(entities=f"'{entities_str}'", limit=len(entities))
+                return template.substitute(entities=entities_str, limit=len(entities))
             
             elif aggregation == "average" and grouping != "none":
                 # Build time-aware compound query
                 time_period_select, time_period_group, time_condition = self._build_time_aware_components(grouping, time_window)
                 
                 template = self.sql_templates["compound_time_aware"]
-                return template.format(
-                    entities=f"'{entities_str}'",
+                return template.substitute(
+                    entities=entities_str,
                     time_period_select=time_period_select,
                     time_period_group=time_period_group,
                     time_condition=time_condition
@@ -324,76 +703,39 @@ class QueryBuilder:
             else:
                 # Default compound query
                 template = self.sql_templates["comparison"]
-                return template.format(entities=f"'{entities_str}'")
+                return template.substitute(entities=entities_str)
                 
         except Exception as e:
-            logger.error(f"❌ Error building compound SQL: {e}")
+            logger.error("❌ Error building compound SQL: %s", e)
             return self._get_fallback_sql(entities[0] if entities else "temperature")
     
     def _parse_time_range(self, time_range: str) -> Dict[str, int]:
-        """Parse time range string to SQL time window"""
+        """Parse time range string to SQL time window (shared dicts; callers must not mutate them)"""
         time_range_lower = time_range.lower()
         
-        # Parse different time range formats
-        if "last_3_days" in time_range_lower or "three_days" in time_range_lower:
-            return {"days": 3, "hours": 72, "minutes": 4320}
-        elif "last_7_days" in time_range_lower or "one_week" in time_range_lower:
-            return {"days": 7, "hours": 168, "minutes": 10080}
-        elif "last_2_days" in time_range_lower or "two_days" in time_range_lower:
-            return {"days": 2, "hours": 48, "minutes": 2880}
-        elif "last_24_hours" in time_range_lower or "one_day" in time_range_lower:
-            return {"days": 1, "hours": 24, "minutes": 1440}
-        elif "last_4_hours" in time_range_lower or "four_hours" in time_range_lower:
-            return {"days": 0, "hours": 4, "minutes": 240}
-        elif "last_6_hours" in time_range_lower or "six_hours" in time_range_lower:
-            return {"days": 0, "hours": 6, "minutes": 360}
-        elif "last_8_hours" in time_range_lower or "eight_hours" in time_range_lower:
-            return {"days": 0, "hours": 8, "minutes": 480}
-        elif "last_12_hours" in time_range_lower or "twelve_hours" in time_range_lower:
-            return {"days": 0, "hours": 12, "minutes": 720}
-        elif "last_2_hours" in time_range_lower or "two_hours" in time_range_lower:
-            return {"days": 0, "hours": 2, "minutes": 120}
-        elif "last_hour" in time_range_lower or "one_hour" in time_range_lower:
-            return {"days": 0, "hours": 1, "minutes": 60}
-        elif "last_30_minutes" in time_range_lower:
-            return {"days": 0, "hours": 0, "minutes": 30}
-        elif "last_4_weeks" in time_range_lower or "four_weeks" in time_range_lower:
-            return {"days": 28, "hours": 672, "minutes": 40320}
-        elif "last_2_weeks" in time_range_lower or "two_weeks" in time_range_lower:
-            return {"days": 14, "hours": 336, "minutes": 20160}
-        elif "last_week" in time_range_lower or "one_week" in time_range_lower:
-            return {"days": 7, "hours": 168, "minutes": 10080}
-        else:
-            # Default to last 24 hours
-            return {"days": 1, "hours": 24, "minutes": 1440}
+        window = _TIME_RANGE_TABLE.get(time_range_lower)
+        if window is not None:
+            return window
+        
+        match = _TIME_RANGE_RE.search(time_range_lower)
+        if match:
+            return _scaled_time_window(int(match.group(1)), match.group(2))
+        
+        # Named spans embedded in longer strings, e.g. "the_three_days_before"
+        for needle, window in _TIME_RANGE_NEEDLES:
+            if needle in time_range_lower:
+                return window
+        
+        # Default to last 24 hours
+        return _DEFAULT_TIME_WINDOW
     
-    def _build_time_aware_components(self, grouping: str, time_window: Dict[str, int]) -> tuple:
+    def _build_time_aware_components(self, grouping: str, time_window: Dict[str, int]) -> Tuple[str, str, str]:
         """Build time-aware SQL components for compound queries"""
-        if grouping in ["by_day", "daily"]:
-            time_period_select = "DATE(timestamp) as time_period"
-            time_period_group = "DATE(timestamp)"
-            time_condition = f"timestamp >= datetime('now', '-{time_window['days']} days')"
-        elif grouping in ["by_hour", "hourly"]:
-            time_period_select = "strftime('%Y-%m-%d %H:00', timestamp) as time_period"
-            time_period_group = "strftime('%Y-%m-%d %H:00', timestamp)"
-            time_condition = f"timestamp >= datetime('now', '-{time_window['hours']} hours')"
-        elif grouping in ["by_minute", "minutely"]:
-            time_period_select = "strftime('%Y-%m-%d %H:%M', timestamp) as time_period"
-            time_period_group = "strftime('%Y-%m-%d %H:%M', timestamp)"
-            time_condition = f"timestamp >= datetime('now', '-{time_window['minutes']} minutes')"
-        elif grouping in ["by_week", "weekly"]:
-            time_period_select = "strftime('%Y-%W', timestamp) as time_period"
-            time_period_group = "strftime('%Y-%W', timestamp)"
-            time_condition = f"timestamp >= datetime('now', '-{time_window['days']} days')"
-        else:
-            # Default to daily
-            time_period_select = "DATE(timestamp) as time_period"
-            time_period_group = "DATE(timestamp)"
-            time_condition = f"timestamp >= datetime('now', '-{time_window['days']} days')"
-        
-        return time_period_select, time_period_group, time_condition
+        # Unknown groupings default to daily
+        time_period_select, time_period_group, condition_format, window_key = _GROUP_PARTS.get(grouping, _DAY_GROUP_PARTS)
+        return time_period_select, time_period_group, condition_format % time_window[window_key]
     
-    def _build_entity_comparison_sql(self, entities: List[str], aggregation: str, time_range: str) -> str:
+    def _build_entity_comparison_sql(self, entities: List[str], aggregation: str, time_range: Union[str, List[str]]) -> str:
         """Build SQL for comparing multiple entities (sensors)"""
         try:
             # Convert to single time range if needed
@@ -403,7 +745,7 @@ class QueryBuilder:
             else:
                 time_condition = "timestamp >= datetime('now', '-7 days')"  # fallback
             
-            entities_str = "', '".join(entities)
+            entities_str = _quote_in(tuple(entities))
             
             sql = f"""
                 SELECT sensor_type,
@@ -412,490 +754,136 @@ class QueryBuilder:
                        MAX(value) as max_value,
                        COUNT(*) as data_points
                 FROM sensor_data
-                WHERE sensor_type IN ('{entities_str}')
+                WHERE sensor_type IN ({entities_str})
                 AND {time_condition}
                 GROUP BY sensor_type
                 ORDER BY sensor_type ASC
             """
             
-            logger.info(f"🔧 Built entity comparison SQL for entities: {entities}")
+            logger.info("🔧 Built entity comparison SQL for entities: %s", entities)
             return sql.strip()
             
         except Exception as e:
-            logger.error(f"❌ Error building entity comparison SQL: {e}")
+            logger.error("❌ Error building entity comparison SQL: %s", e)
             return self._get_fallback_sql(entities[0] if entities else "temperature")
     
-    def _build_time_comparison_sql(self, entity: str, time_ranges: List[str], aggregation: str, grouping: str) -> str:
+    def _build_time_comparison_sql(self, entity: Union[str, List[str]], time_ranges: List[str], aggregation: str, grouping: str) -> str:
         """Build SQL for comparing time ranges with proper aggregation"""
+        # Handle multiple entities
+        if isinstance(entity, list):
+            entities = entity
+        else:
+            entities = [entity]
+        
+        # Sub-grouping within each range; by default one aggregate per range
+        group_by = _RANGE_SUBGROUP.get(grouping, "1")
+        
+        # Get time filters from the unified service: (label, start_iso, end_iso, condition).
+        # This is the only step that can fail on unexpected input.
         try:
-            # Handle multiple entities
-            if isinstance(entity, list):
-                entities = entity
-            else:
-                entities = [entity]
-            
-            # Build UNION query for multiple time ranges with proper aggregation
-            union_queries = []
-            
-            for time_range in time_ranges:
-                # Get time filter from the unified service
-                from app.services.unified_semantic_service import UnifiedSemanticQueryService
-                service = UnifiedSemanticQueryService()
-                label, start_iso, end_iso, condition = service._time_range_to_sql_filter(time_range)
-                
-                # Build aggregation based on grouping
-                if grouping == "by_week":
-                    group_by = "strftime('%Y-%W', timestamp)"
-                    time_period_select = f"strftime('%Y-%W', timestamp) as time_period"
-                elif grouping == "by_month":
-                    group_by = "strftime('%Y-%m', timestamp)"
-                    time_period_select = f"strftime('%Y-%m', timestamp) as time_period"
-                elif grouping == "by_day":
-                    group_by = "DATE(timestamp)"
-                    time_period_select = f"DATE(timestamp) as time_period"
-                else:
-                    # Default to single aggregated value for the entire range
-                    group_by = "1"  # Group all rows together
-                    time_period_select = f"'{label}' as time_period"
-                
-                # Handle multiple entities for each time range
-                for entity_name in entities:
-                    union_queries.append(f"""
-                        SELECT '{label}' as time_period,
-                               '{entity_name}' as sensor_type,
-                               AVG(value) as avg_value,
-                               MIN(value) as min_value,
-                               MAX(value) as max_value,
-                               COUNT(*) as data_points
-                        FROM sensor_data
-                        WHERE sensor_type = '{entity_name}'
-                        AND {condition}
-                        GROUP BY {group_by}
-                    """)
-            
-            if not union_queries:
-                # IMPROVED FALLBACK: Use granularity-based logic instead of hardcoded today/yesterday
-                # Check if we have explicit ranges from semantic_json
-                if isinstance(time_ranges, list) and len(time_ranges) > 0:
-                    # Use the provided ranges
-                    for time_range in time_ranges:
-                        if time_range.startswith("past_"):
-                            # Build dynamic condition for past_n_hours/days
-                            for entity_name in entities:
-                                union_queries.append(self._build_dynamic_time_condition(entity_name, time_range, aggregation, grouping))
-                        else:
-                            # Use existing logic for standard ranges
-                            from app.services.unified_semantic_service import UnifiedSemanticQueryService
-                            service = UnifiedSemanticQueryService()
-                            label, start_iso, end_iso, condition = service._time_range_to_sql_filter(time_range)
-                            for entity_name in entities:
-                                union_queries.append(f"""
-                                    SELECT '{label}' as time_period,
-                                           '{entity_name}' as sensor_type,
-                                           AVG(value) as avg_value,
-                                           MIN(value) as min_value,
-                                           MAX(value) as max_value,
-                                           COUNT(*) as data_points
-                                    FROM sensor_data
-                                    WHERE sensor_type = '{entity_name}'
-                                    AND {condition}
-                                """)
-                else:
-                    # GRANULARITY-BASED FALLBACK: Use granularity to determine appropriate comparison
-                    # This replaces the hardcoded today/yesterday fallback
-                    if hasattr(self, 'current_granularity'):
-                        granularity = self.current_granularity
-                    else:
-                        granularity = "day"  # default
-                    
-                    if granularity == "hour":
-                        # Compare last hour vs previous hour
-                        union_queries = [
-                            f"""
-                                SELECT 'last_hour' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND timestamp >= datetime('now', '-1 hour')
-                            """,
-                            f"""
-                                SELECT 'previous_hour' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND timestamp >= datetime('now', '-2 hour') AND timestamp < datetime('now', '-1 hour')
-                            """
-                        ]
-                    elif granularity == "day":
-                        # Compare today vs yesterday
-                        union_queries = [
-                            f"""
-                                SELECT 'today' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND DATE(timestamp) = DATE('now')
-                            """,
-                            f"""
-                                SELECT 'yesterday' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND DATE(timestamp) = DATE('now', '-1 day')
-                            """
-                        ]
-                    elif granularity == "week":
-                        # Compare this week vs last week
-                        union_queries = [
-                            f"""
-                                SELECT 'this_week' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND strftime('%Y-%W', timestamp) = strftime('%Y-%W', 'now')
-                            """,
-                            f"""
-                                SELECT 'last_week' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND strftime('%Y-%W', timestamp) = strftime('%Y-%W', 'now', '-7 days')
-                            """
-                        ]
-                    else:
-                        # Default to today vs yesterday
-                        union_queries = [
-                            f"""
-                                SELECT 'today' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND DATE(timestamp) = DATE('now')
-                            """,
-                            f"""
-                                SELECT 'yesterday' as time_period,
-                                       '{entity}' as sensor_type,
-                                       AVG(value) as avg_value,
-                                       MIN(value) as min_value,
-                                       MAX(value) as max_value,
-                                       COUNT(*) as data_points
-                                FROM sensor_data
-                                WHERE sensor_type = '{entity}'
-                                AND DATE(timestamp) = DATE('now', '-1 day')
-                            """
-                        ]
-            
-            sql = " UNION ALL ".join(union_queries) + " ORDER BY time_period ASC"
-            
-            logger.info(f"🔧 Built time comparison SQL for entity '{entity}' across ranges: {time_ranges}")
-            return sql.strip()
-            
-        except Exception as e:
-            logger.error(f"❌ Error building time comparison SQL: {e}")
-            return self._get_fallback_sql(entity if isinstance(entity, str) else "temperature")
-    
-    def _build_dynamic_time_condition(self, entity: str, time_range: str, aggregation: str, grouping: str) -> str:
-        """Build dynamic time condition for past_n_hours/days expressions"""
-        try:
-            import re
-            
-            # Extract number and unit from past_n_hours or past_n_days
-            hour_match = re.search(r'past_(\d+)_hours', time_range)
-            day_match = re.search(r'past_(\d+)_days', time_range)
-            
-            if hour_match:
-                hours = int(hour_match.group(1))
-                return f"""
-                    SELECT '{time_range}' as time_period,
-                           '{entity}' as sensor_type,
-                           AVG(value) as avg_value,
-                           MIN(value) as min_value,
-                           MAX(value) as max_value,
-                           COUNT(*) as data_points
-                    FROM sensor_data
-                    WHERE sensor_type = '{entity}'
-                    AND timestamp >= datetime('now', '-{hours} hours')
-                """
-            elif day_match:
-                days = int(day_match.group(1))
-                return f"""
-                    SELECT '{time_range}' as time_period,
-                           '{entity}' as sensor_type,
-                           AVG(value) as avg_value,
-                           MIN(value) as min_value,
-                           MAX(value) as max_value,
-                           COUNT(*) as data_points
-                    FROM sensor_data
-                    WHERE sensor_type = '{entity}'
-                    AND timestamp >= datetime('now', '-{days} days')
-                """
-            else:
-                # Fallback to generic past condition
-                return f"""
-                    SELECT '{time_range}' as time_period,
-                           '{entity}' as sensor_type,
-                           AVG(value) as avg_value,
-                           MIN(value) as min_value,
-                           MAX(value) as max_value,
-                           COUNT(*) as data_points
-                    FROM sensor_data
-                    WHERE sensor_type = '{entity}'
-                    AND timestamp >= datetime('now', '-1 day')
-                """
-        except Exception as e:
-            logger.error(f"Error building dynamic time condition: {e}")
-            return f"""
-                SELECT '{time_range}' as time_period,
-                       '{entity}' as sensor_type,
-                       AVG(value) as avg_value,
-                       MIN(value) as min_value,
-                       MAX(value) as max_value,
-                       COUNT(*) as data_points
-                FROM sensor_data
-                WHERE sensor_type = '{entity}'
-                AND timestamp >= datetime('now', '-1 day')
-            """
-    
-    def _build_comparison_sql(self, entity: str, time_ranges: List[str], aggregation: str, grouping: str) -> str:
-        """Build SQL for comparison queries with multiple time ranges"""
-        try:
-            # Handle multiple entities
-            if isinstance(entity, list):
-                entities_str = "', '".join(entity)
-                entity_condition = f"sensor_type IN ('{entities_str}')"
-            else:
-                entity_condition = f"sensor_type = '{entity}'"
-            
-            # Build time conditions for each range
-            time_conditions = []
-            for time_range in time_ranges:
-                condition = self._build_time_condition_for_range(time_range)
-                if condition:
-                    time_conditions.append(condition)
-            
-            if not time_conditions:
-                # Fallback to last 2 days
-                time_conditions = ["timestamp >= datetime('now', '-2 days')"]
-            
-            # Build the complete SQL
-            if grouping in ["by_day", "daily"]:
-                time_period_select = "DATE(timestamp) as time_period"
-                time_period_group = "DATE(timestamp)"
-            elif grouping in ["by_hour", "hourly"]:
-                time_period_select = "strftime('%Y-%m-%d %H:00', timestamp) as time_period"
-                time_period_group = "strftime('%Y-%m-%d %H:00', timestamp)"
-            elif grouping in ["by_week", "weekly"]:
-                time_period_select = "strftime('%Y-%W', timestamp) as time_period"
-                time_period_group = "strftime('%Y-%W', timestamp)"
-            else:
-                # Default to daily
-                time_period_select = "DATE(timestamp) as time_period"
-                time_period_group = "DATE(timestamp)"
-            
-            # Combine time conditions with OR
-            combined_time_condition = " OR ".join([f"({cond})" for cond in time_conditions])
-            
-            sql = f"""
-                SELECT {time_period_select}, sensor_type,
-                       AVG(value) as avg_value,
-                       MIN(value) as min_value,
-                       MAX(value) as max_value,
-                       COUNT(*) as data_points
-                FROM sensor_data
-                WHERE {entity_condition}
-                AND ({combined_time_condition})
-                GROUP BY {time_period_group}, sensor_type
-                ORDER BY {time_period_group} ASC, sensor_type ASC
-            """
-            
-            logger.info(f"🔧 Built comparison SQL: {sql}")
-            return sql
-            
+            service = self._get_semantic_service()
+            filters = [service._time_range_to_sql_filter(time_range) for time_range in time_ranges]
         except Exception as e:
-            logger.error(f"❌ Error building comparison SQL: {e}")
+            logger.error("❌ Error building time comparison SQL: %s", e)
             return self._get_fallback_sql(entity if isinstance(entity, str) else "temperature")
-    
-    def _build_time_condition_for_range(self, time_range: str) -> str:
-        """Build SQL time condition for a specific time range"""
-        time_range_lower = time_range.lower()
         
-        # Handle expanded time ranges (e.g., "4_hours_ago", "2_days_ago")
-        if "_hours_ago" in time_range_lower:
-            import re
-            match = re.search(r'(\d+)_hours_ago', time_range_lower)
-            if match:
-                hours = int(match.group(1))
-                return f"timestamp >= datetime('now', '-{hours} hours')"
-        
-        elif "_days_ago" in time_range_lower:
-            import re
-            match = re.search(r'(\d+)_days_ago', time_range_lower)
-            if match:
-                days = int(match.group(1))
-                return f"timestamp >= datetime('now', '-{days} days')"
-        
-        elif "_weeks_ago" in time_range_lower:
-            import re
-            match = re.search(r'(\d+)_weeks_ago', time_range_lower)
-            if match:
-                weeks = int(match.group(1))
-                days = weeks * 7
-                return f"timestamp >= datetime('now', '-{days} days')"
+        if len(filters) > 1 and _disjoint_ranges(filters):
+            # Non-overlapping ranges: one scan over their envelope, bucketed by CASE
+            union_queries = [_bucketed_ranges_sql(filters, entities, group_by)]
+        else:
+            # Overlapping ranges count shared rows in each range, so they need one
+            # branch per (range, entity), filled into a pre-sized list and joined once at the end
+            union_queries = [None] * (len(entities) * len(filters))
+            idx = 0
+            for label, start_iso, end_iso, condition in filters:
+                for entity_name in entities:
+                    union_queries[idx] = _range_aggregate_sql(label, entity_name, condition, group_by)
+                    idx += 1
         
-        # Handle past_n_hours/days patterns
-        elif time_range_lower.startswith("past_") and "_hours" in time_range_lower:
-            import re
-            match = re.search(r'past_(\d+)_hours', time_range_lower)
-            if match:
-                hours = int(match.group(1))
-                return f"timestamp >= datetime('now', '-{hours} hours')"
+        if not union_queries:
+            # GRANULARITY-BASED FALLBACK: Use granularity to determine appropriate comparison
+            # This replaces the hardcoded today/yesterday fallback
+            if hasattr(self, 'current_granularity'):
+                granularity = self.current_granularity
+            else:
+                granularity = "day"  # default
+            
+            # Only the sensor varies: head + entity + mid + entity + tail
+            name = str(entity)
+            head, mid, tail = _FALLBACK_COMPARISON_PARTS.get(granularity, _FALLBACK_COMPARISON_PARTS["day"])
+            union_queries = [head + name + mid + name + tail]
         
-        elif time_range_lower.startswith("past_") and "_days" in time_range_lower:
-            import re
-            match = re.search(r'past_(\d+)_days', time_range_lower)
-            if match:
-                days = int(match.group(1))
-                return f"timestamp >= datetime('now', '-{days} days')"
+        # Branches are already compact, so one join plus the ORDER BY tail is the whole statement
+        sql = " UNION ALL ".join(union_queries) + " ORDER BY time_period ASC"
         
-        # Handle standard time ranges
-        elif time_range_lower == "today":
-            return "DATE(timestamp) = DATE('now')"
-        elif time_range_lower == "yesterday":
-            return "DATE(timestamp) = DATE('now', '-1 day')"
-        elif time_range_lower == "this_week":
-            return "timestamp >= datetime('now', 'weekday 0', '-6 days')"
-        elif time_range_lower == "last_week":
-            return "timestamp BETWEEN datetime('now', 'weekday 0', '-13 days') AND datetime('now', 'weekday 0', '-7 days')"
-        elif time_range_lower == "this_month":
-            return "timestamp >= datetime('now', 'start of month')"
-        elif time_range_lower == "last_month":
-            return "timestamp BETWEEN datetime('now', 'start of month', '-1 month') AND datetime('now', 'start of month')"
-        elif time_range_lower == "this_year":
-            return "timestamp >= datetime('now', 'start of year')"
-        elif time_range_lower == "last_year":
-            return "timestamp BETWEEN datetime('now', 'start of year', '-1 year') AND datetime('now', 'start of year')"
-        else:
-            return None
+        logger.info("🔧 Built time comparison SQL for entity '%s' across ranges: %s", entity, time_ranges)
+        return sql
     
     def _get_fallback_sql(self, entity: str) -> str:
         """Get fallback SQL query"""
-        return f"SELECT * FROM sensor_data WHERE sensor_type = '{entity}' ORDER BY timestamp DESC LIMIT 5"
+        sql = self._fallback_sql.get(entity)
+        return sql if sql is not None else _fallback_sql_for(entity)
     
-    def _get_previous_time_range(self, time_range: str) -> str:
+    def _get_previous_time_range(self, time_range: str) -> Optional[str]:
         """Get the previous time range for comparison"""
-        if "hours_ago" in time_range:
-            import re
-            match = re.search(r'(\d+)_hours_ago', time_range)
-            if match:
-                hours = int(match.group(1))
-                return f"{hours * 2}_hours_ago"
-        elif "days_ago" in time_range:
-            import re
-            match = re.search(r'(\d+)_days_ago', time_range)
-            if match:
-                days = int(match.group(1))
-                return f"{days * 2}_days_ago"
-        elif "weeks_ago" in time_range:
-            import re
-            match = re.search(r'(\d+)_weeks_ago', time_range)
-            if match:
-                weeks = int(match.group(1))
-                return f"{weeks * 2}_weeks_ago"
-        else:
-            # Default fallback
-            return "yesterday"
+        return _previous_time_range(time_range)
     
     def _build_daily_breakdown_sql(self, entity: str, time_range: str, aggregation: str, grouping: str) -> str:
         """Build SQL for time-based breakdown of time ranges (e.g., last 3 days -> daily data, last 6 hours -> hourly data)"""
+        sql = self._breakdown_sql(f"'{entity}'", time_range)
+        if sql is None:
+            return self._get_fallback_sql(entity)
+        logger.info("🔧 Built breakdown SQL for entity '%s' over range '%s'", entity, time_range)
+        return sql
+    
+    def _build_daily_breakdown_query(self, entity: str, time_range: str) -> Tuple[str, tuple]:
+        """_build_daily_breakdown_sql with the sensor bound as a parameter"""
+        sql = self._breakdown_sql("?", time_range)
+        if sql is None:
+            return _FALLBACK_PARAM_SQL, (entity,)
+        return sql, (entity,)
+    
+    def _breakdown_sql(self, entity_sql: str, time_range: str) -> Optional[str]:
+        """Breakdown SQL over time_range with entity_sql (a quoted literal or ?) as the sensor, None on error"""
+        # Get time filter from the unified service
         try:
-            # Get time filter from the unified service
-            from app.services.unified_semantic_service import UnifiedSemanticQueryService
-            service = UnifiedSemanticQueryService()
+            service = self._get_semantic_service()
             label, start_iso, end_iso, condition = service._time_range_to_sql_filter(time_range)
-            
-            # Determine appropriate grouping based on time range and granularity
-            if "hour" in time_range or "ساعت" in time_range:
-                # Hourly breakdown for hour-based queries
-                time_period_select = "strftime('%Y-%m-%d %H:00', timestamp) as time_period"
-                group_by = "strftime('%Y-%m-%d %H:00', timestamp)"
-                period_label = "hour"
-            elif "week" in time_range or "هفته" in time_range:
-                # Weekly breakdown for week-based queries
-                time_period_select = "strftime('%Y-%W', timestamp) as time_period"
-                group_by = "strftime('%Y-%W', timestamp)"
-                period_label = "week"
-            elif "month" in time_range or "ماه" in time_range:
-                # Monthly breakdown for month-based queries
-                time_period_select = "strftime('%Y-%m', timestamp) as time_period"
-                group_by = "strftime('%Y-%m', timestamp)"
-                period_label = "month"
-            else:
-                # Default to daily breakdown
-                time_period_select = "DATE(timestamp) as time_period"
-                group_by = "DATE(timestamp)"
-                period_label = "day"
-            
-            # Build time-based breakdown with trend analysis
-            sql = f"""
-                SELECT 
-                    {time_period_select},
-                    sensor_type,
-                    AVG(value) as avg_value,
-                    MIN(value) as min_value,
-                    MAX(value) as max_value,
-                    COUNT(*) as data_points,
-                    ROUND(AVG(value), 2) as period_avg,
-                    ROUND(MAX(value) - MIN(value), 2) as period_range
-                FROM sensor_data
-                WHERE sensor_type = '{entity}'
-                AND {condition}
-                GROUP BY {group_by}, sensor_type
-                ORDER BY time_period ASC
-            """
-            
-            logger.info(f"🔧 Built {period_label} breakdown SQL for entity '{entity}' over range '{time_range}'")
-            return sql.strip()
-            
         except Exception as e:
-            logger.error(f"❌ Error building {period_label} breakdown SQL: {e}")
-            return self._get_fallback_sql(entity)
+            logger.error("❌ Error building breakdown SQL: %s", e)
+            return None
+        
+        # Break down by the first unit the range mentions (English or Persian), else by day
+        time_period_select, group_by = _DAY_GROUP_PARTS[:2]
+        for words, select, group in _BREAKDOWN_GROUPING:
+            if words[0] in time_range or words[1] in time_range:
+                time_period_select, group_by = select, group
+                break
+        
+        # Build time-based breakdown with trend analysis
+        sql = f"""
+            SELECT 
+                {time_period_select},
+                sensor_type,
+                AVG(value) as avg_value,
+                MIN(value) as min_value,
+                MAX(value) as max_value,
+                COUNT(*) as data_points,
+                ROUND(AVG(value), 2) as period_avg,
+                ROUND(MAX(value) - MIN(value), 2) as period_range
+            FROM sensor_data
+            WHERE sensor_type = {entity_sql}
+            AND {condition}
+            GROUP BY {group_by}, sensor_type
+            ORDER BY time_period ASC
+        """
+        return sql.strip()
     
     def validate_semantic_json(self, semantic_json: Dict[str, Any]) -> Dict[str, Any]:
         """Validate semantic JSON structure"""
         try:
-            required_fields = ["entity"]
-            optional_fields = ["aggregation", "time_range", "grouping", "format"]
-            
             # Check required fields
-            for field in required_fields:
+            for field in _REQUIRED_FIELDS:
                 if field not in semantic_json:
                     return {
                         "valid": False,
@@ -929,23 +917,21 @@ class QueryBuilder:
                 }
             
             # Validate aggregation
-            valid_aggregations = ["current", "latest", "average", "min", "max", "count"]
-            aggregation = semantic_json.get("aggregation", "current")
-            if aggregation not in valid_aggregations:
+            aggregation = semantic_json.get("aggregation", _DEFAULT_AGGREGATION)
+            if aggregation not in _VALID_AGGREGATIONS:
                 return {
                     "valid": False,
                     "error": f"Invalid aggregation: {aggregation}",
-                    "suggestions": [f"Use one of: {', '.join(valid_aggregations)}"]
+                    "suggestions": [_AGGREGATION_SUGGESTION]
                 }
             
             # Validate grouping
-            valid_groupings = ["none", "by_day", "daily", "by_hour", "hourly", "by_minute", "minutely", "by_week", "weekly"]
-            grouping = semantic_json.get("grouping", "none")
-            if grouping not in valid_groupings:
+            grouping = semantic_json.get("grouping", _DEFAULT_GROUPING)
+            if grouping not in _VALID_GROUPINGS:
                 return {
                     "valid": False,
                     "error": f"Invalid grouping: {grouping}",
-                    "suggestions": [f"Use one of: {', '.join(valid_groupings)}"]
+                    "suggestions": [_GROUPING_SUGGESTION]
                 }
             
             return {
@@ -967,16 +953,16 @@ class QueryBuilder:
             sensor_mappings = self.ontology.get("sensor_mappings", {})
             return list(sensor_mappings.keys())
         except Exception as e:
-            logger.error(f"❌ Error getting supported entities: {e}")
+            logger.error("❌ Error getting supported entities: %s", e)
             return ["temperature", "humidity", "soil_moisture", "water_usage", "pest_count"]
     
     def get_supported_aggregations(self) -> List[str]:
         """Get list of supported aggregations"""
-        return ["current", "latest", "average", "min", "max", "count"]
+        return list(_SUPPORTED_AGGREGATIONS)
     
     def get_supported_groupings(self) -> List[str]:
         """Get list of supported groupings"""
-        return ["none", "by_day", "daily", "by_hour", "hourly", "by_minute", "minutely", "by_week", "weekly"]
+        return list(_SUPPORTED_GROUPINGS)
     
     def get_supported_time_ranges(self) -> List[str]:
         """Get list of supported time ranges"""
@@ -1,12 +1,59 @@
 import sqlite3
 import json
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# orjson (in requirements.txt) encodes the stored JSON columns several times faster;
+# stdlib json reads and writes the same TEXT if it is missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Metrics and chart data often carry numpy/pandas values straight from query results
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    
+    def _orjson_default(value: Any) -> Any:
+        """Fallback for values orjson can't encode: numpy scalars become floats, the rest strings"""
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+    
+    def _dumps(value: Any) -> str:
+        """Serialize a JSON column value (non-str keys are stringified like json.dumps does)"""
+        return orjson.dumps(value, default=_orjson_default, option=_ORJSON_OPTIONS).decode()
+    
+    _loads = orjson.loads
+else:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# Max characters of query/response kept in compact conversation-context records
+CONTEXT_SNIPPET_LENGTH = 200
+
+# Per-connection tuning: WAL commits only need NORMAL sync, and sorts/temp tables stay in
+# memory with a ~20MB page cache. journal_mode=WAL itself persists in the file (see _init_tables)
+_CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+# Prepared statements kept per connection; every statement here is a fixed text with ? parameters
+STATEMENT_CACHE_SIZE = 256
+
+def _snippet(text: str) -> str:
+    """Truncate text for the compact conversation context"""
+    return text[:CONTEXT_SNIPPET_LENGTH] + "..." if len(text) > CONTEXT_SNIPPET_LENGTH else text
+
 class SessionStorage:
     """Database-based session storage for queries, responses, SQL, and semantic JSON"""
     
@@ -21,87 +68,154 @@ class SessionStorage:
                 self.db_path = "smart_dashboard.db"
         else:
             self.db_path = db_path
+        # One long-lived connection per thread, so WAL readers still run alongside the writer.
+        # An in-memory database lives only inside its connection, so all threads share one
+        self._local = threading.local()
+        self._shared_conn = self._connect(check_same_thread=False) if self.db_path == ":memory:" else None
+        self._shared_lock = threading.Lock()
         self._init_tables()
     
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        """Open a connection to the session database with the tuned PRAGMAs applied"""
+        conn = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=check_same_thread)
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """This thread's connection to the session database (opened on first use) for a with block
+        
+        The shared in-memory connection is locked for the block, since sqlite3 connections
+        must not run statements from several threads at once. Writers also enter the
+        connection itself so a failed statement is rolled back rather than left open on
+        the kept connection.
+        """
+        if self._shared_conn is not None:
+            with self._shared_lock:
+                yield self._shared_conn
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        yield conn
+    
+    def close(self):
+        """Close the calling thread's connection (it is reopened on next use)
+        
+        The shared in-memory connection stays open, since closing it would drop the database.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+    
     def _init_tables(self):
         """Initialize session storage tables"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create session storage table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS session_storage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    query TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    sql_query TEXT,
-                    semantic_json TEXT,
-                    metrics TEXT,
-                    chart_data TEXT,
-                    timestamp TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            with self._connection() as conn, conn:
+                cursor = conn.cursor()
+                
+                # WAL lets readers run alongside the writer; in-memory databases cannot use it
+                if self.db_path != ":memory:":
+                    cursor.execute("PRAGMA journal_mode=WAL")
+                
+                # Create session storage table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS session_storage (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        query TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        sql_query TEXT,
+                        semantic_json TEXT,
+                        metrics TEXT,
+                        chart_data TEXT,
+                        timestamp TEXT NOT NULL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Create session metadata table
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS session_metadata (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        is_active BOOLEAN DEFAULT 1,
+                        total_queries INTEGER DEFAULT 0
+                    )
+                ''')
+                
+                # Create compact conversation-context table (pre-truncated, read on every query)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS session_context (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        session_id TEXT NOT NULL,
+                        ctx_record TEXT NOT NULL,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                
+                # Create indexes for performance
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_id ON session_storage(session_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_metadata_id ON session_metadata(session_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_last_activity ON session_metadata(last_activity)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_context_id ON session_context(session_id, id)')
             
-            # Create session metadata table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS session_metadata (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1,
-                    total_queries INTEGER DEFAULT 0
-                )
-            ''')
-            
-            # Create indexes for performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_id ON session_storage(session_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_metadata_id ON session_metadata(session_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_last_activity ON session_metadata(last_activity)')
-            
-            conn.commit()
-            conn.close()
             logger.info("Session storage tables initialized")
             
         except Exception as e:
             logger.error(f"Error initializing session storage tables: {e}")
     
+    def ping(self) -> bool:
+        """Check that the session database is reachable"""
+        try:
+            with self._connection() as conn:
+                conn.execute('SELECT 1')
+                return True
+        except Exception as e:
+            logger.error(f"Session storage ping failed: {e}")
+            return False
+    
     def save_session_data(self, session_id: str, query: str, response: str, 
                          sql_query: str = None, semantic_json: Dict = None, 
                          metrics: Dict = None, chart_data: Dict = None) -> bool:
         """Save session data to database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Save session data
-            cursor.execute('''
-                INSERT INTO session_storage 
-                (session_id, query, response, sql_query, semantic_json, metrics, chart_data, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                session_id,
-                query,
-                response,
-                sql_query,
-                json.dumps(semantic_json) if semantic_json else None,
-                json.dumps(metrics) if metrics else None,
-                json.dumps(chart_data) if chart_data else None,
-                datetime.utcnow().isoformat()
-            ))
-            
-            # Update session metadata
-            cursor.execute('''
-                INSERT OR REPLACE INTO session_metadata 
-                (session_id, last_activity, total_queries)
-                VALUES (?, ?, COALESCE((SELECT total_queries FROM session_metadata WHERE session_id = ?), 0) + 1)
-            ''', (session_id, datetime.utcnow().isoformat(), session_id))
-            
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                cursor = conn.cursor()
+                
+                # Save session data
+                cursor.execute('''
+                    INSERT INTO session_storage 
+                    (session_id, query, response, sql_query, semantic_json, metrics, chart_data, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    session_id,
+                    query,
+                    response,
+                    sql_query,
+                    _dumps(semantic_json) if semantic_json else None,
+                    _dumps(metrics) if metrics else None,
+                    _dumps(chart_data) if chart_data else None,
+                    datetime.utcnow().isoformat()
+                ))
+                
+                # Save compact context record alongside the full audit record
+                cursor.execute('''
+                    INSERT INTO session_context (session_id, ctx_record)
+                    VALUES (?, ?)
+                ''', (session_id, f"User: {_snippet(query)}\nAssistant: {_snippet(response)}"))
+                
+                # Update session metadata
+                cursor.execute('''
+                    INSERT OR REPLACE INTO session_metadata 
+                    (session_id, last_activity, total_queries)
+                    VALUES (?, ?, COALESCE((SELECT total_queries FROM session_metadata WHERE session_id = ?), 0) + 1)
+                ''', (session_id, datetime.utcnow().isoformat(), session_id))
             
             logger.info(f"Session data saved for session: {session_id}")
             return True
@@ -113,77 +227,95 @@ class SessionStorage:
     def get_session_context(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
         """Retrieve past context for follow-up queries"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT query, response, sql_query, semantic_json, metrics, timestamp
-                FROM session_storage 
-                WHERE session_id = ? 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (session_id, limit))
-            
-            results = cursor.fetchall()
-            conn.close()
-            
-            context = []
-            for row in results:
-                context.append({
-                    'query': row[0],
-                    'response': row[1],
-                    'sql_query': row[2],
-                    'semantic_json': json.loads(row[3]) if row[3] else None,
-                    'metrics': json.loads(row[4]) if row[4] else None,
-                    'timestamp': row[5]
-                })
-            
-            logger.info(f"Retrieved {len(context)} context items for session: {session_id}")
-            return context
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT query, response, sql_query, semantic_json, metrics, timestamp
+                    FROM session_storage 
+                    WHERE session_id = ? 
+                    ORDER BY created_at DESC 
+                    LIMIT ?
+                ''', (session_id, limit))
+                
+                results = cursor.fetchall()
+                
+                context = []
+                for row in results:
+                    context.append({
+                        'query': row[0],
+                        'response': row[1],
+                        'sql_query': row[2],
+                        'semantic_json': _loads(row[3]) if row[3] else None,
+                        'metrics': _loads(row[4]) if row[4] else None,
+                        'timestamp': row[5]
+                    })
+                
+                logger.info(f"Retrieved {len(context)} context items for session: {session_id}")
+                return context
             
         except Exception as e:
             logger.error(f"Error retrieving session context: {e}")
             return []
     
+    def get_context_records(self, session_id: str, limit: int = 5) -> List[str]:
+        """Retrieve pre-truncated context records (most recent first) for prompt context"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT ctx_record
+                    FROM session_context 
+                    WHERE session_id = ? 
+                    ORDER BY id DESC 
+                    LIMIT ?
+                ''', (session_id, limit))
+                
+                records = [row[0] for row in cursor.fetchall()]
+                return records
+            
+        except Exception as e:
+            logger.error(f"Error retrieving context records: {e}")
+            return []
+    
     def get_session_summary(self, session_id: str) -> Dict[str, Any]:
         """Get session summary with key metrics"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Get session metadata
-            cursor.execute('''
-                SELECT created_at, last_activity, total_queries, is_active
-                FROM session_metadata 
-                WHERE session_id = ?
-            ''', (session_id,))
-            
-            metadata = cursor.fetchone()
-            if not metadata:
-                conn.close()
-                return None
-            
-            # Get recent queries
-            cursor.execute('''
-                SELECT COUNT(*) as total_queries,
-                       COUNT(CASE WHEN sql_query IS NOT NULL THEN 1 END) as sql_queries,
-                       COUNT(CASE WHEN semantic_json IS NOT NULL THEN 1 END) as semantic_queries
-                FROM session_storage 
-                WHERE session_id = ?
-            ''', (session_id,))
-            
-            stats = cursor.fetchone()
-            conn.close()
-            
-            return {
-                'session_id': session_id,
-                'created_at': metadata[0],
-                'last_activity': metadata[1],
-                'total_queries': metadata[2],
-                'is_active': bool(metadata[3]),
-                'sql_queries': stats[1] if stats else 0,
-                'semantic_queries': stats[2] if stats else 0
-            }
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                # Get session metadata
+                cursor.execute('''
+                    SELECT created_at, last_activity, total_queries, is_active
+                    FROM session_metadata 
+                    WHERE session_id = ?
+                ''', (session_id,))
+                
+                metadata = cursor.fetchone()
+                if not metadata:
+                    return None
+                
+                # Get recent queries
+                cursor.execute('''
+                    SELECT COUNT(*) as total_queries,
+                           COUNT(CASE WHEN sql_query IS NOT NULL THEN 1 END) as sql_queries,
+                           COUNT(CASE WHEN semantic_json IS NOT NULL THEN 1 END) as semantic_queries
+                    FROM session_storage 
+                    WHERE session_id = ?
+                ''', (session_id,))
+                
+                stats = cursor.fetchone()
+                
+                return {
+                    'session_id': session_id,
+                    'created_at': metadata[0],
+                    'last_activity': metadata[1],
+                    'total_queries': metadata[2],
+                    'is_active': bool(metadata[3]),
+                    'sql_queries': stats[1] if stats else 0,
+                    'semantic_queries': stats[2] if stats else 0
+                }
             
         except Exception as e:
             logger.error(f"Error getting session summary: {e}")
@@ -192,23 +324,21 @@ class SessionStorage:
     def expire_sessions(self, timeout_minutes: int = 30) -> int:
         """Expire sessions after timeout"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Calculate cutoff time
-            cutoff_time = datetime.utcnow() - timedelta(minutes=timeout_minutes)
-            cutoff_iso = cutoff_time.isoformat()
-            
-            # Update expired sessions
-            cursor.execute('''
-                UPDATE session_metadata 
-                SET is_active = 0 
-                WHERE last_activity < ? AND is_active = 1
-            ''', (cutoff_iso,))
-            
-            expired_count = cursor.rowcount
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                cursor = conn.cursor()
+                
+                # Calculate cutoff time
+                cutoff_time = datetime.utcnow() - timedelta(minutes=timeout_minutes)
+                cutoff_iso = cutoff_time.isoformat()
+                
+                # Update expired sessions
+                cursor.execute('''
+                    UPDATE session_metadata 
+                    SET is_active = 0 
+                    WHERE last_activity < ? AND is_active = 1
+                ''', (cutoff_iso,))
+                
+                expired_count = cursor.rowcount
             
             logger.info(f"Expired {expired_count} sessions after {timeout_minutes} minutes timeout")
             return expired_count
@@ -220,29 +350,32 @@ class SessionStorage:
     def cleanup_expired_sessions(self, days_to_keep: int = 7) -> int:
         """Clean up expired session data older than specified days"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Calculate cutoff time
-            cutoff_time = datetime.utcnow() - timedelta(days=days_to_keep)
-            cutoff_iso = cutoff_time.isoformat()
-            
-            # Delete expired session data
-            cursor.execute('''
-                DELETE FROM session_storage 
-                WHERE created_at < ?
-            ''', (cutoff_iso,))
-            
-            deleted_count = cursor.rowcount
-            
-            # Delete expired metadata
-            cursor.execute('''
-                DELETE FROM session_metadata 
-                WHERE created_at < ? AND is_active = 0
-            ''', (cutoff_iso,))
-            
-            conn.commit()
-            conn.close()
+            with self._connection() as conn, conn:
+                cursor = conn.cursor()
+                
+                # Calculate cutoff time
+                cutoff_time = datetime.utcnow() - timedelta(days=days_to_keep)
+                cutoff_iso = cutoff_time.isoformat()
+                
+                # Delete expired session data
+                cursor.execute('''
+                    DELETE FROM session_storage 
+                    WHERE created_at < ?
+                ''', (cutoff_iso,))
+                
+                deleted_count = cursor.rowcount
+                
+                # Delete expired context records
+                cursor.execute('''
+                    DELETE FROM session_context 
+                    WHERE created_at < ?
+                ''', (cutoff_iso,))
+                
+                # Delete expired metadata
+                cursor.execute('''
+                    DELETE FROM session_metadata 
+                    WHERE created_at < ? AND is_active = 0
+                ''', (cutoff_iso,))
             
             logger.info(f"Cleaned up {deleted_count} expired session records")
             return deleted_count
@@ -254,29 +387,28 @@ class SessionStorage:
     def get_active_sessions(self) -> List[Dict[str, Any]]:
         """Get list of active sessions"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT session_id, created_at, last_activity, total_queries
-                FROM session_metadata 
-                WHERE is_active = 1 
-                ORDER BY last_activity DESC
-            ''')
-            
-            results = cursor.fetchall()
-            conn.close()
-            
-            sessions = []
-            for row in results:
-                sessions.append({
-                    'session_id': row[0],
-                    'created_at': row[1],
-                    'last_activity': row[2],
-                    'total_queries': row[3]
-                })
-            
-            return sessions
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT session_id, created_at, last_activity, total_queries
+                    FROM session_metadata 
+                    WHERE is_active = 1 
+                    ORDER BY last_activity DESC
+                ''')
+                
+                results = cursor.fetchall()
+                
+                sessions = []
+                for row in results:
+                    sessions.append({
+                        'session_id': row[0],
+                        'created_at': row[1],
+                        'last_activity': row[2],
+                        'total_queries': row[3]
+                    })
+                
+                return sessions
             
         except Exception as e:
             logger.error(f"Error getting active sessions: {e}")
@@ -399,7 +399,7 @@ class UnifiedSemanticQueryService:
         self.ontology = self._build_comprehensive_ontology()
         
         # Initialize QueryBuilder for semantic JSON to SQL conversion
-        self.query_builder = QueryBuilder(self.ontology)
+        self.query_builder = QueryBuilder(self.ontology, semantic_service=self)
         
         # Initialize conversation memory (session-based)
         self.conversation_memories = {}  # session_id -> ConversationBufferMemory
@@ -1866,13 +1866,13 @@ EXAMPLES:
             # Include time_context in semantic_json metadata
             if time_context:
                 semantic_json["time_context"] = time_context
-            sql_query = self.query_builder.build_sql_from_semantic_json(semantic_json)
-            print(f" SQL FROM SEMANTIC JSON: {sql_query}")
+            sql_query, sql_params = self.query_builder.build_parameterized_sql(semantic_json)
+            print(f" SQL FROM SEMANTIC JSON: {sql_query} {sql_params}")
             logger.info(f" Generated SQL from semantic JSON: {sql_query}")
             logger.debug(f"SQL generation details: semantic_json={semantic_json} -> sql={sql_query}")
             
             # Step 3: Execute SQL with validation
-            execution_result = self._execute_direct_sql(sql_query)
+            execution_result = self._execute_direct_sql(sql_query, sql_params)
             
             # Step 4: Check if execution was successful
             if not execution_result["success"]:
@@ -1881,6 +1881,7 @@ EXAMPLES:
                 logger.error(f" ERROR: Execution result: {execution_result}")
                 return {
                     "sql": sql_query,
+                    "sql_params": list(sql_params),
                     "raw_data": [],
                     "success": False,
                     "error": execution_result["error"],
@@ -1897,6 +1898,7 @@ EXAMPLES:
                 logger.error(f" ERROR: Validation result: {validation_result}")
                 return {
                     "sql": sql_query,
+                    "sql_params": list(sql_params),
                     "raw_data": [],
                     "success": False,
                     "error": validation_result.get("message", "Query validation failed"),
@@ -1921,6 +1923,7 @@ EXAMPLES:
                     # CRITICAL: Return failure when no data is found
                     return {
                         "sql": sql_query,
+                        "sql_params": list(sql_params),
                         "raw_data": [],
                         "success": False,
                         "error": "No data available for the requested time range and sensor type",
@@ -1932,6 +1935,7 @@ EXAMPLES:
             # Step 8: Return successful result only if we have data
             return {
                 "sql": sql_query,
+                "sql_params": list(sql_params),
                 "raw_data": execution_result["data"],
                 "success": True,
                 "validation": execution_result.get("validation", {}),
@@ -3922,13 +3926,13 @@ Always provide reasoning and confidence score."""
         else:
             return "SELECT timestamp, sensor_type, value FROM sensor_data ORDER BY timestamp DESC LIMIT 10"
     
-    def _execute_direct_sql(self, sql_query: str) -> Dict[str, Any]:
-        """Execute SQL query directly and return results with validation"""
+    def _execute_direct_sql(self, sql_query: str, params: tuple = ()) -> Dict[str, Any]:
+        """Execute SQL query directly (binding any ? parameters) and return results with validation"""
         try:
             import sqlite3
             
             # Step 1: Validate SQL query before execution
-            validation_result = self._validate_sql_query(sql_query)
+            validation_result = self._validate_sql_query(sql_query, params)
             if not validation_result["valid"]:
                 logger.error(f" SQL Validation Failed: {validation_result['message']}")
                 return {
@@ -3957,7 +3961,7 @@ Always provide reasoning and confidence score."""
                 # Log the query being executed
                 logger.info(f" Executing SQL Query: {sql_query}")
                 
-                cursor.execute(sql_query)
+                cursor.execute(sql_query, params)
                 results = cursor.fetchall()
                 
                 # Step 4: Get column names
@@ -3980,7 +3984,8 @@ Always provide reasoning and confidence score."""
                     "data": data,
                     "validation": validation_result,
                     "columns": columns,
-                    "query_executed": sql_query
+                    "query_executed": sql_query,
+                    "query_params": list(params)
                 }
                 
             except sqlite3.Error as e:
@@ -4005,10 +4010,12 @@ Always provide reasoning and confidence score."""
                 "validation": {"valid": False, "message": f"Connection error: {str(e)}"}
             }
     
-    def _validate_sql_query(self, sql_query: str) -> Dict[str, Any]:
-        """Validate SQL query for safety and correctness"""
+    def _validate_sql_query(self, sql_query: str, params: tuple = ()) -> Dict[str, Any]:
+        """Validate SQL query (and its bound parameters) for safety and correctness"""
         try:
             sql_lower = sql_query.lower().strip()
+            # Sensor types may be bound parameters rather than literals
+            bound_lower = " ".join(str(param).lower() for param in params)
             
             # Check 1: Only SELECT queries allowed
             if not sql_lower.startswith('select'):
@@ -4053,7 +4060,7 @@ Always provide reasoning and confidence score."""
             has_valid_sensor_type = False
             for sensor_type in valid_sensor_types:
                 # Check for sensor type with quotes (both single and double)
-                if f"'{sensor_type}'" in sql_lower or f'"{sensor_type}"' in sql_lower or sensor_type in sql_lower:
+                if f"'{sensor_type}'" in sql_lower or f'"{sensor_type}"' in sql_lower or sensor_type in sql_lower or sensor_type in bound_lower:
                     has_valid_sensor_type = True
                     print(f" Found valid sensor type: {sensor_type}")
                     break
@@ -4075,7 +4082,7 @@ Always provide reasoning and confidence score."""
             return {
                 "valid": True,
                 "message": "Query validation passed",
-                "sensor_types_found": [st for st in valid_sensor_types if st in sql_lower],
+                "sensor_types_found": [st for st in valid_sensor_types if st in sql_lower or st in bound_lower],
                 "query_type": "SELECT",
                 "table_used": "sensor_data"
             }